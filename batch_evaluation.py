@@ -0,0 +1,167 @@
+import chess
+import numpy as np
+from constants import PIECE_SQUARE_TABLES, DRAW_VALUE
+from board_evaluation_functions import piece_values, scheme_terms
+from board_evaluation_functions import DOUBLED_PAWN_PENALTY, ISOLATED_PAWN_PENALTY, PASSED_PAWN_BONUS
+from board_evaluation_functions import adjacent_files_masks, passed_pawn_masks, king_shield_masks, king_shield_sizes
+
+# Planes 0-5 hold the White pawns, knights, bishops, rooks, queens and king, planes 6-11 the
+# Black ones; plane index = 6 * (color == BLACK) + piece_type - 1
+PLANE_COLORS = (chess.WHITE, chess.BLACK)
+WHITE_PAWNS, WHITE_KING = 0, 5
+BLACK_PAWNS, BLACK_KING = 6, 11
+
+# Score of one piece on a plane, from White's point of view
+PLANE_SIGNS = np.array([1] * 6 + [-1] * 6, dtype=np.int32)
+MATERIAL_WEIGHTS = PLANE_SIGNS * np.array([piece_values[piece_type] for piece_type in chess.PIECE_TYPES] * 2, dtype=np.int32)
+PST_WEIGHTS = PLANE_SIGNS[:, None] * np.array([PIECE_SQUARE_TABLES[color][piece_type - 1]
+                                               for color in PLANE_COLORS for piece_type in chess.PIECE_TYPES], dtype=np.int32)
+
+
+def bitboard_planes(mask):
+  """ 0/1 array of the squares in each bitboard of `mask`, with the square index last. """
+  return np.unpackbits(mask.astype('<u8')[..., None].view(np.uint8), axis=-1, bitorder='little')
+
+# Bitboard tables of board_evaluation_functions as 0/1 planes
+ADJACENT_FILES = bitboard_planes(np.array(adjacent_files_masks, dtype=np.uint64))[:, :8].astype(np.int32)
+# float32 so the passed-pawn product runs as a BLAS matmul; the counts (at most 64) stay exact
+PASSED_PAWN_PLANES = bitboard_planes(np.array(passed_pawn_masks, dtype=np.uint64)).astype(np.float32)
+KING_SHIELD_PLANES = bitboard_planes(np.array(king_shield_masks, dtype=np.uint64))
+KING_SHIELD_SIZES = np.array(king_shield_sizes, dtype=np.int32)
+
+POPCOUNT_BYTES = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.int32)
+
+def popcount(mask):
+  """ Number of squares in each bitboard of the uint64 array `mask`. """
+  return POPCOUNT_BYTES[np.ascontiguousarray(mask)[..., None].view(np.uint8)].sum(axis=-1)
+
+# Board directions as (shift, squares that can be reached): a shift onto the excluded files has
+# wrapped around the board edge
+NOT_FILE_A = np.uint64(chess.BB_ALL & ~chess.BB_FILE_A)
+NOT_FILE_H = np.uint64(chess.BB_ALL & ~chess.BB_FILE_H)
+NOT_FILES_AB = np.uint64(chess.BB_ALL & ~(chess.BB_FILE_A | chess.BB_FILE_B))
+NOT_FILES_GH = np.uint64(chess.BB_ALL & ~(chess.BB_FILE_G | chess.BB_FILE_H))
+ALL_SQUARES = np.uint64(chess.BB_ALL)
+
+ROOK_DIRECTIONS = ((8, ALL_SQUARES), (-8, ALL_SQUARES), (1, NOT_FILE_A), (-1, NOT_FILE_H))
+BISHOP_DIRECTIONS = ((9, NOT_FILE_A), (7, NOT_FILE_H), (-7, NOT_FILE_A), (-9, NOT_FILE_H))
+KING_STEPS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KNIGHT_STEPS = ((17, NOT_FILE_A), (15, NOT_FILE_H), (10, NOT_FILES_AB), (6, NOT_FILES_GH),
+                (-6, NOT_FILES_AB), (-10, NOT_FILES_GH), (-15, NOT_FILE_A), (-17, NOT_FILE_H))
+PAWN_CAPTURES = [((-9, NOT_FILE_H), (-7, NOT_FILE_A)), ((7, NOT_FILE_H), (9, NOT_FILE_A))]
+
+def shift(mask, direction):
+  delta, reachable = direction
+  if delta > 0:
+    return (mask << np.uint64(delta)) & reachable
+  return (mask >> np.uint64(-delta)) & reachable
+
+def ray_attacks(sliders, direction, empty):
+  """ Squares attacked along `direction` by the sliders, up to and including the first piece. """
+  attacks = np.zeros_like(sliders)
+  front = sliders
+  for _ in range(7):
+    front = shift(front, direction)
+    attacks |= front
+    front &= empty
+  return attacks
+
+
+def encode_boards(boards):
+  """ (N, 12) uint64 array of the piece bitboards of `boards`, in plane order. """
+  masks = []
+  for board in boards:
+    for occupied in (board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]):
+      masks += (board.pawns & occupied, board.knights & occupied, board.bishops & occupied,
+                board.rooks & occupied, board.queens & occupied, board.kings & occupied)
+  return np.array(masks, dtype=np.uint64).reshape(len(boards), 12)
+
+def board_planes(boards):
+  """ (N, 12, 64) uint8 bitplanes of `boards`. """
+  return bitboard_planes(encode_boards(boards))
+
+
+# TERMS
+# Each takes the (N, 12) bitboards and (N, 12, 64) planes and returns an (N,) int32 array,
+# White minus Black. Colours index the tables as int(color): NumPy takes a bool index as a mask.
+def batch_material(bitboards, planes):
+  return planes.sum(axis=2, dtype=np.int32) @ MATERIAL_WEIGHTS
+
+def batch_piece_position(bitboards, planes):
+  return np.einsum('nps,ps->n', planes, PST_WEIGHTS, dtype=np.int32)
+
+def batch_pawn_counts(own_pawns, enemy_pawns, color):
+  """ Doubled, isolated and passed pawns of one side, each an (N,) array. """
+  file_counts = own_pawns.reshape(-1, 8, 8).sum(axis=1, dtype=np.int32)
+  doubled = np.maximum(file_counts - 1, 0).sum(axis=1)
+  isolated = (file_counts * (file_counts @ ADJACENT_FILES == 0)).sum(axis=1)
+  # Enemy pawns on each pawn's passed-pawn mask
+  blockers = enemy_pawns.astype(np.float32) @ PASSED_PAWN_PLANES[int(color)].T
+  passed = (own_pawns * (blockers == 0)).sum(axis=1, dtype=np.int32)
+  return doubled, isolated, passed
+
+def batch_pawn_structure(bitboards, planes):
+  white = batch_pawn_counts(planes[:, WHITE_PAWNS], planes[:, BLACK_PAWNS], chess.WHITE)
+  black = batch_pawn_counts(planes[:, BLACK_PAWNS], planes[:, WHITE_PAWNS], chess.BLACK)
+  weights = (DOUBLED_PAWN_PENALTY, ISOLATED_PAWN_PENALTY, PASSED_PAWN_BONUS)
+  return sum((w - b) * weight for w, b, weight in zip(white, black, weights)).astype(np.int32)
+
+def batch_king_shield(planes, color):
+  pawns, king = (WHITE_PAWNS, WHITE_KING) if color == chess.WHITE else (BLACK_PAWNS, BLACK_KING)
+  king_squares = planes[:, king].argmax(axis=1)
+  shield_pawns = (KING_SHIELD_PLANES[int(color)][king_squares] & planes[:, pawns]).sum(axis=1, dtype=np.int32)
+  return shield_pawns - KING_SHIELD_SIZES[int(color)][king_squares]
+
+def batch_king_safety(bitboards, planes):
+  return batch_king_shield(planes, chess.WHITE) - batch_king_shield(planes, chess.BLACK)
+
+def batch_attacks(bitboards, color, empty):
+  """ (squares attacked, number of attackers summed over all squares) for the pieces of `color`.
+
+  In any one direction the attack sets of different pieces are disjoint (a ray stops at the
+  first piece it meets), so the attackers are counted as the popcount of each direction's union.
+  """
+  first = WHITE_PAWNS if color == chess.WHITE else BLACK_PAWNS
+  pawns, knights, bishops, rooks, queens, kings = (bitboards[:, first + i] for i in range(6))
+  attack_sets = [shift(pawns, direction) for direction in PAWN_CAPTURES[int(color)]]
+  attack_sets += [shift(knights, direction) for direction in KNIGHT_STEPS]
+  attack_sets += [shift(kings, direction) for direction in KING_STEPS]
+  attack_sets += [ray_attacks(rooks | queens, direction, empty) for direction in ROOK_DIRECTIONS]
+  attack_sets += [ray_attacks(bishops | queens, direction, empty) for direction in BISHOP_DIRECTIONS]
+  return np.bitwise_or.reduce(attack_sets), sum(popcount(attacks) for attacks in attack_sets)
+
+def batch_square_control(bitboards, planes):
+  # dynamic_weakening plus dynamic_reinforcement
+  empty = ~np.bitwise_or.reduce(bitboards, axis=1)
+  white_attacked, white_attackers = batch_attacks(bitboards, chess.WHITE, empty)
+  black_attacked, black_attackers = batch_attacks(bitboards, chess.BLACK, empty)
+  weakening = popcount(black_attacked) - popcount(white_attacked)
+  return (weakening + white_attackers - black_attackers).astype(np.int32)
+
+batch_term_functions = {
+  'material': batch_material,
+  'king_safety': batch_king_safety,
+  'piece_position': batch_piece_position,
+  'square_control': batch_square_control,
+  'pawn_structure': batch_pawn_structure
+}
+
+
+def evaluate_board_batch(boards, scheme='material_count', check_draw=True):
+  """ evaluate_board for every board in `boards` at once, as an (N,) int32 array.
+
+  The boards are encoded once as bitboards and bitplanes and every term is computed for the
+  whole batch; only the insufficient-material test is still made board by board.
+  """
+  evaluations = np.zeros(len(boards), dtype=np.int32)
+  if not boards:
+    return evaluations
+  bitboards = encode_boards(boards)
+  planes = bitboard_planes(bitboards)
+  for term in scheme_terms.get(scheme, ('material',)):
+    value = batch_term_functions[term](bitboards, planes)
+    if term == 'material' and check_draw:
+      insufficient = np.array([board.is_insufficient_material() for board in boards])
+      value = np.where(insufficient, DRAW_VALUE, value).astype(np.int32)
+    evaluations += value
+  return evaluations
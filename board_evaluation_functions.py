@@ -1,7 +1,8 @@
 import chess
 from constants import PAWN_VALUE, KNIGHT_VALUE, BISHOP_VALUE, ROOK_VALUE, QUEEN_VALUE
-from constants import PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE
-from constants import ROOK_TABLE, QUEEN_TABLE, KING_TABLE, DRAW_VALUE
+from constants import PIECE_SQUARE_TABLES, DRAW_VALUE
+from pawn_hash import PawnHashTable, pawn_key
+from evaluation_cache import board_key
 from stockfish import Stockfish
 
 # Configure the Stockfish engine
@@ -21,176 +22,232 @@ piece_values = {
 def material_count(board):
     score = 0
     for piece_type in piece_values:
-        white_pieces = board.pieces(piece_type, chess.WHITE) # Might need to fix!!
-        black_pieces = board.pieces(piece_type, chess.BLACK)
-        score += piece_values[piece_type] * (len(white_pieces) - len(black_pieces))
+        white_pieces = board.pieces_mask(piece_type, chess.WHITE)
+        black_pieces = board.pieces_mask(piece_type, chess.BLACK)
+        score += piece_values[piece_type] * (chess.popcount(white_pieces) - chess.popcount(black_pieces))
     return score
 
 # SQUARE CONTROL EVALUATION
-def evaluate_square_control(board):
-    weakening_values = dynamic_weakening(board)
-    reinforcement_values = dynamic_reinforcement(board)
-    combined_control_values = [w + r for w, r in zip(weakening_values, reinforcement_values)]
-    control_score = sum(combined_control_values)
-    return control_score
+# Both terms are computed from the attack bitboard of each piece: a square attacked by a side
+# is in the union of its pieces' attack sets, and the number of a side's attackers summed over
+# all squares is the sum of the sizes of those sets.
+def evaluate_square_control(board, pawn_attack_sets=None):
+    # pawn_attack_sets: pawn_attacks() by colour, when already at hand from pawn_entry
+    if pawn_attack_sets is None:
+        pawn_attack_sets = (pawn_attacks(board, chess.BLACK), pawn_attacks(board, chess.WHITE))
+    # Each piece's attacks_mask is computed once and shared by both terms
+    attack_sets = [pawn_attack_sets[color] + tuple(piece_attacks(board, color)) for color in (chess.BLACK, chess.WHITE)]
+    return dynamic_weakening(attack_sets) + dynamic_reinforcement(attack_sets)
+
+def pawn_attacks(board, color):
+    """ Attack sets of all pawns of `color` as two shifted bitboards, one per capture direction. """
+    pawns = board.pieces_mask(chess.PAWN, color)
+    if color == chess.WHITE:
+        return (pawns & ~chess.BB_FILE_A) << 7, ((pawns & ~chess.BB_FILE_H) << 9) & chess.BB_ALL
+    return (pawns & ~chess.BB_FILE_A) >> 9, (pawns & ~chess.BB_FILE_H) >> 7
+
+def piece_attacks(board, color):
+    """ Attack bitboard of every non-pawn piece of `color`. """
+    pieces = board.occupied_co[color] & ~board.pawns
+    return [board.attacks_mask(square) for square in chess.scan_forward(pieces)]
+
+def dynamic_weakening(attack_sets):
+    # -1 for each square White attacks, +1 for each square Black attacks
+    # attack_sets: pawn and piece attack bitboards by colour
+    score = 0
+    for color, sign in ((chess.WHITE, -1), (chess.BLACK, 1)):
+        attacked = 0
+        for attacks in attack_sets[color]:
+            attacked |= attacks
+        score += sign * chess.popcount(attacked)
+    return score
 
-def dynamic_weakening(board):
-    square_values = [0] * 64
-    for square in chess.SQUARES:
-        if board.is_attacked_by(chess.WHITE, square):
-            square_values[square] -= 1  # Weakening by White attack
-        if board.is_attacked_by(chess.BLACK, square):
-            square_values[square] += 1  # Weakening by Black attack
-    return square_values
-
-def dynamic_reinforcement(board):
-    square_reinforcement = [0] * 64
-    for square in chess.SQUARES:
-        white_defenders = board.attackers(chess.WHITE, square)
-        black_defenders = board.attackers(chess.BLACK, square)
-        square_reinforcement[square] += len(white_defenders) - len(black_defenders)
-    return square_reinforcement
+def dynamic_reinforcement(attack_sets):
+    # White attackers minus Black attackers, summed over all squares
+    score = 0
+    for color, sign in ((chess.WHITE, 1), (chess.BLACK, -1)):
+        score += sign * sum(chess.popcount(attacks) for attacks in attack_sets[color])
+    return score
 
 # PIECE POSITION EVALUATION
 def piece_position_evaluation(board):
+    # Each side scored with its own (mirrored) tables, see constants.PIECE_SQUARE_TABLES
     control_score = 0
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            row, col = divmod(square, 8)
-            piece_type = piece.piece_type
-            piece_color = piece.color
-
-            if piece_type == chess.PAWN:
-                piece_value = PAWN_TABLE[row][col]
-            elif piece_type == chess.KNIGHT:
-                piece_value = KNIGHT_TABLE[row][col]
-            elif piece_type == chess.BISHOP:
-                piece_value = BISHOP_TABLE[row][col]
-            elif piece_type == chess.ROOK:
-                piece_value = ROOK_TABLE[row][col]
-            elif piece_type == chess.QUEEN:
-                piece_value = QUEEN_TABLE[row][col]
-            elif piece_type == chess.KING:
-                piece_value = KING_TABLE[row][col]
-            else:
-                continue
-
-            # Adjust the total control score based on the color of the piece
-            if piece_color == chess.WHITE:
-                control_score += piece_value
-            else:
-                control_score -= piece_value
-
+    white_tables = PIECE_SQUARE_TABLES[chess.WHITE]
+    black_tables = PIECE_SQUARE_TABLES[chess.BLACK]
+    for piece_type in chess.PIECE_TYPES:
+        table = white_tables[piece_type - 1]
+        for square in chess.scan_forward(board.pieces_mask(piece_type, chess.WHITE)):
+            control_score += table[square]
+        table = black_tables[piece_type - 1]
+        for square in chess.scan_forward(board.pieces_mask(piece_type, chess.BLACK)):
+            control_score -= table[square]
     return control_score
 
 
 # PAWN STRUCTURE EVALUATION
+DOUBLED_PAWN_PENALTY = -10
+ISOLATED_PAWN_PENALTY = -20
+PASSED_PAWN_BONUS = 20
+
+adjacent_files_masks = [(chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+                        for file in range(8)]
+
+def passed_pawn_mask(square, color):
+    """ Squares in front of a pawn, on its own and the adjacent files. """
+    files = chess.BB_FILES[chess.square_file(square)] | adjacent_files_masks[chess.square_file(square)]
+    rank = chess.square_rank(square)
+    if color == chess.WHITE:
+        ahead = chess.BB_ALL ^ ((1 << (8 * (rank + 1))) - 1)
+    else:
+        ahead = (1 << (8 * rank)) - 1
+    return files & ahead
+
+# Squares that must hold no enemy pawn for a pawn to be passed, by [color][square]
+passed_pawn_masks = [[passed_pawn_mask(square, color) for square in chess.SQUARES] for color in (chess.BLACK, chess.WHITE)]
+
+# Pawn-structure results depend on the pawns only, so they are cached by pawn_key
+pawn_table = PawnHashTable()
+
+def pawn_entry(board):
+    """ (pawn_structure_score, pawn attack sets by colour) for the board's pawns, from pawn_table. """
+    key = pawn_key(board)
+    entry = pawn_table.probe(key)
+    if entry is None:
+        attacks = (pawn_attacks(board, chess.BLACK), pawn_attacks(board, chess.WHITE))
+        entry = (pawn_structure_score(board), attacks)
+        pawn_table.store(key, entry)
+    return entry
+
 def count_doubled_pawns(board, color):
     doubled_pawns = 0
-    for file in range(8):
-        pawns_in_file = list(board.pieces(chess.PAWN, color)).count(file)
+    pawns = board.pieces_mask(chess.PAWN, color)
+    for file_mask in chess.BB_FILES:
+        pawns_in_file = chess.popcount(pawns & file_mask)
         if pawns_in_file > 1:
             doubled_pawns += (pawns_in_file - 1)
     return doubled_pawns
 
 def count_isolated_pawns(board, color):
     isolated_pawns = 0
+    pawns = board.pieces_mask(chess.PAWN, color)
     for file in range(8):
-        if not list(board.pieces(chess.PAWN, color)).count(file - 1) and not list(board.pieces(chess.PAWN, color)).count(file + 1):
-            isolated_pawns += list(board.pieces(chess.PAWN, color)).count(file)
+        if not pawns & adjacent_files_masks[file]:
+            isolated_pawns += chess.popcount(pawns & chess.BB_FILES[file])
     return isolated_pawns
 
-def pawn_structure_evaluation(board):
-    white_doubled_pawns = count_doubled_pawns(board, chess.WHITE)
-    black_doubled_pawns = count_doubled_pawns(board, chess.BLACK)
-    white_isolated_pawns = count_isolated_pawns(board, chess.WHITE)
-    black_isolated_pawns = count_isolated_pawns(board, chess.BLACK)
-
-    # Assign penalties for doubled and isolated pawns
-    doubled_pawn_penalty = -10
-    isolated_pawn_penalty = -20
+def count_passed_pawns(board, color):
+    enemy_pawns = board.pieces_mask(chess.PAWN, not color)
+    return sum(1 for square in chess.scan_forward(board.pieces_mask(chess.PAWN, color))
+               if not enemy_pawns & passed_pawn_masks[color][square])
 
+def pawn_structure_score(board):
     evaluation = 0
-    evaluation += (white_doubled_pawns - black_doubled_pawns) * doubled_pawn_penalty
-    evaluation += (white_isolated_pawns - black_isolated_pawns) * isolated_pawn_penalty
-
+    evaluation += (count_doubled_pawns(board, chess.WHITE) - count_doubled_pawns(board, chess.BLACK)) * DOUBLED_PAWN_PENALTY
+    evaluation += (count_isolated_pawns(board, chess.WHITE) - count_isolated_pawns(board, chess.BLACK)) * ISOLATED_PAWN_PENALTY
+    evaluation += (count_passed_pawns(board, chess.WHITE) - count_passed_pawns(board, chess.BLACK)) * PASSED_PAWN_BONUS
     return evaluation
 
+def pawn_structure_evaluation(board):
+    return pawn_entry(board)[0]
+
 # KING SAFETY EVALUATION
 def king_safety_evaluation(board):
     white_king_safety = evaluate_king_shield(board, chess.WHITE)
     black_king_safety = evaluate_king_shield(board, chess.BLACK)
     return white_king_safety - black_king_safety
 
+def king_shield_mask(square, color):
+    """ Squares on the king's file and the adjacent files, on its rank and the rank in front. """
+    files = range(max(0, square % 8 - 1), min(8, square % 8 + 2))
+    ranks = [square // 8, square // 8 + (1 if color == chess.WHITE else -1)]
+    return [chess.square(file, rank) for file in files for rank in ranks if 0 <= rank <= 7]
+
+# Shield squares as a bitboard and their number, by [color][king square]
+king_shield_masks = [[chess.SquareSet(king_shield_mask(square, color)).mask for square in chess.SQUARES]
+                     for color in (chess.BLACK, chess.WHITE)]
+king_shield_sizes = [[len(king_shield_mask(square, color)) for square in chess.SQUARES]
+                     for color in (chess.BLACK, chess.WHITE)]
+
 def evaluate_king_shield(board, color):
+    # -1 for every shield square without a pawn of the king's colour
     king_square = board.king(color)
-    king_shield_penalty = 0
-    pawn_shield_files = range(max(0, king_square % 8 - 1), min(8, king_square % 8 + 2))
-    pawn_shield_ranks = [king_square // 8, king_square // 8 + (1 if color == chess.WHITE else -1)]
-    pawn_shield_ranks = [r for r in pawn_shield_ranks if 0 <= r <= 7]
-    for file in pawn_shield_files:
-        for rank in pawn_shield_ranks:
-            if not board.piece_at(chess.square(file, rank)) == chess.Piece(chess.PAWN, color):
-                king_shield_penalty -= 1
-
-    return king_shield_penalty
+    shield_pawns = king_shield_masks[color][king_square] & board.pieces_mask(chess.PAWN, color)
+    return chess.popcount(shield_pawns) - king_shield_sizes[color][king_square]
 
 # EVALUATE BOARD
-def evaluate_board(board, scheme='material_count'):
-    if scheme == 'king_safety':
-        evaluation = simple_evaluation(board)
-        evaluation += king_safety_evaluation(board)
-    elif scheme == 'piece_position':
-        evaluation = simple_evaluation(board)
-        evaluation += piece_position_evaluation(board)
-    elif scheme == 'square_control':
-        evaluation = simple_evaluation(board)
-        evaluation += evaluate_square_control(board)
-    elif scheme == 'pawn_structure':
-        evaluation = simple_evaluation(board)
-        evaluation += pawn_structure_evaluation(board)
-    elif scheme == 'combined':
-        evaluation = simple_evaluation(board)
-        evaluation += king_safety_evaluation(board)
-        evaluation += piece_position_evaluation(board)
-        evaluation += evaluate_square_control(board)
-        evaluation += pawn_structure_evaluation(board)
-    else:
-        evaluation = simple_evaluation(board)
-        
-    return evaluation
-
-# SIMPLE EVAL -- MATERIAL COUNT
-
-def simple_evaluation(board):
-    if board.is_insufficient_material():
-        return DRAW_VALUE
-
-    wp = len(board.pieces(chess.PAWN, chess.WHITE))
-    bp = len(board.pieces(chess.PAWN, chess.BLACK))
+# Every scheme is material plus some of these terms
+term_functions = {
+    'material': material_count,
+    'king_safety': king_safety_evaluation,
+    'piece_position': piece_position_evaluation,
+    'square_control': evaluate_square_control,
+    'pawn_structure': pawn_structure_evaluation
+}
 
-    wn = len(board.pieces(chess.KNIGHT, chess.WHITE))
-    bn = len(board.pieces(chess.KNIGHT, chess.BLACK))
+scheme_terms = {
+    'material_count': ('material',),
+    'king_safety': ('material', 'king_safety'),
+    'piece_position': ('material', 'piece_position'),
+    'square_control': ('material', 'square_control'),
+    'pawn_structure': ('material', 'pawn_structure'),
+    'combined': ('material', 'king_safety', 'piece_position', 'square_control', 'pawn_structure')
+}
 
-    wb = len(board.pieces(chess.BISHOP, chess.WHITE))
-    bb = len(board.pieces(chess.BISHOP, chess.BLACK))
+def evaluate_terms(board, terms):
+    # {term: value}; pawn structure and square control share one pawn_entry lookup
+    values = {}
+    pawn_attack_sets = None
+    if 'pawn_structure' in terms:
+        values['pawn_structure'], pawn_attack_sets = pawn_entry(board)
+    for term in terms:
+        if term == 'square_control':
+            values[term] = evaluate_square_control(board, pawn_attack_sets)
+        elif term != 'pawn_structure':
+            values[term] = term_functions[term](board)
+    return values
+
+def cached_evaluation(board, scheme, terms, cache):
+    # Whole-scheme result if cached, else the sum of the cached terms plus the missing ones.
+    # Schemes are cached as (key, scheme) and terms as (key, 'term', term), shared by all schemes.
+    key = board_key(board)
+    evaluation = cache.get((key, scheme))
+    if evaluation is not None:
+        return evaluation
+
+    values = {}
+    missing = []
+    for term in terms:
+        value = cache.get((key, 'term', term), term=True)
+        if value is None:
+            missing.append(term)
+        else:
+            values[term] = value
+    for term, value in evaluate_terms(board, missing).items():
+        cache.put((key, 'term', term), value)
+        values[term] = value
+
+    evaluation = sum(values.values())
+    cache.put((key, scheme), evaluation)
+    return evaluation
 
-    wr = len(board.pieces(chess.ROOK, chess.WHITE))
-    br = len(board.pieces(chess.ROOK, chess.BLACK))
+def evaluate_board(board, scheme='material_count', check_draw=True, cache=None):
+    # check_draw=False skips the insufficient-material test for callers that already made it.
+    # cache: the calling engine's EvaluationCache for multi-term schemes; material_count alone is
+    # cheaper than a lookup and is never cached.
+    terms = scheme_terms.get(scheme, ('material',))
+    if check_draw and board.is_insufficient_material():
+        # Material counts as a draw; any positional terms still apply
+        return DRAW_VALUE + sum(evaluate_terms(board, terms[1:]).values())
+    if cache is None or len(terms) == 1:
+        return sum(evaluate_terms(board, terms).values())
+    return cached_evaluation(board, scheme, terms, cache)
 
-    wq = len(board.pieces(chess.QUEEN, chess.WHITE))
-    bq = len(board.pieces(chess.QUEEN, chess.BLACK))
+# SIMPLE EVAL -- MATERIAL COUNT
 
-    value = (
-        PAWN_VALUE * (wp - bp) +
-        KNIGHT_VALUE * (wn - bn) +
-        BISHOP_VALUE * (wb - bb) +
-        ROOK_VALUE * (wr - br) +
-        QUEEN_VALUE * (wq - bq)
-    )
+def simple_evaluation(board, check_draw=True):
+    if check_draw and board.is_insufficient_material():
+        return DRAW_VALUE
 
-    if board.turn == chess.WHITE:
-        return value
-    return -value
\ No newline at end of file
+    # Always from White's point of view, like the other terms and the searches
+    return material_count(board)
\ No newline at end of file
@@ -77,6 +77,15 @@ KING_TABLE = [
   [20, 30, 10, 0, 0, 10, 30, 20]
 ]
 
+# The tables above are drawn from White's side, rank 8 in the first row. Compiled for lookup as
+# PIECE_SQUARE_TABLES[color][piece_type - 1][square], in python-chess square order (a1 = 0, h8 = 63),
+# with Black's tables mirrored so each side reads its own rank 1 at the bottom
+PIECE_TABLES = [PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, ROOK_TABLE, QUEEN_TABLE, KING_TABLE]
+PIECE_SQUARE_TABLES = [
+  [[table[square // 8][square % 8] for square in range(64)] for table in PIECE_TABLES],      # chess.BLACK
+  [[table[7 - square // 8][square % 8] for square in range(64)] for table in PIECE_TABLES]   # chess.WHITE
+]
+
 # Masks for black and white squares for bishop colors
 BLACK_SQUARES_MASK = 0xAA55AA55AA55AA55
 WHITE_SQUARES_MASK = 0x55AA55AA55AA55AA
@@ -2,8 +2,13 @@ import chess
 import matplotlib.pyplot as plt
 import random
 import time
-from mcts_module import select_best_move as mcts_move
-from minimax_module import find_best_move as minimax_move
+import tracemalloc
+from mcts_module import MCTSEngine, mcts_search, best_child, Node, select_leaf, backpropagate
+from minimax_module import MinimaxEngine, search as minimax_line_search
+from mcts_array_tree import ArrayTree
+from board_evaluation_functions import evaluate_board
+from batch_evaluation import evaluate_board_batch
+from evaluation_cache import EvaluationCache
 from stockfish import Stockfish
 from preprocessing import preprocess_puzzles
 
@@ -17,9 +22,20 @@ puzzles_db = preprocess_puzzles(raw_puzzles_db) # pandas dataframe with...
 # headers:     df[['FEN', 'Moves', 'Rating', 'Themes']]
 # example row: {'FEN': 'r1bq1rk1/ppp2ppp/2n1pn2/3p4/2PP4/2NBPN2/PP3PPP/R1BQ1RK1 w - - 0 1', 'Moves': 'e2e4 d7d5 b1c3 g8f6 g1f3 e7e6 f1d3 f8e7 e1g1 e8g8 d2d4 c7c5', 'Rating': 1600, 'Themes': 'Discovered attack, Hanging piece, Pin, Skewer, X-ray attack'}
 
+# Engines are kept per (ai_type, scheme) so consecutive puzzles reuse their tables; they share one
+# evaluation cache, so schemes run on the same puzzles reuse each other's terms
+engines = {}
+evaluation_cache = EvaluationCache()
+
 def get_database():
   return puzzles_db
 
+def get_engine(ai_type, scheme):
+  if (ai_type, scheme) not in engines:
+    engine_class = MCTSEngine if ai_type == "mcts" else MinimaxEngine
+    engines[(ai_type, scheme)] = engine_class(scheme, eval_cache=evaluation_cache)
+  return engines[(ai_type, scheme)]
+
 def get_max_time_for_puzzle(elo_rating):
   if elo_rating < 1500:
     return 10  # Less time for easier puzzles
@@ -60,9 +76,13 @@ def test_ai_on_puzzle(ai_type, puzzle_fen, expected_moves, max_time, max_depth=4
   start_time = time.time()
   # Now let the AI make its move
   if ai_type == "mcts":
-    ai_move = mcts_move(board, max_time, scheme)
+    engine = get_engine(ai_type, scheme)
+    engine.set_position(puzzle_fen, [opponent_move])
+    ai_move = engine.go(max_time)
   elif ai_type == "minimax":
-    ai_move = minimax_move(board, max_depth, max_time, scheme)
+    engine = get_engine(ai_type, scheme)
+    engine.set_position(puzzle_fen, [opponent_move])
+    ai_move = engine.go(max_depth, max_time).move
   elif ai_type == "stockfish":
     sf.set_fen_position(board.fen())
     sf.set_depth(max_time)
@@ -75,6 +95,143 @@ def test_ai_on_puzzle(ai_type, puzzle_fen, expected_moves, max_time, max_depth=4
   is_correct = str(ai_move) == expected_moves.split()[1]
   return is_correct, move_time
 
+def count_solution_moves(pv, expected_moves):
+  # Number of leading solution moves (after the opponent's first move) reproduced by the PV
+  matched = 0
+  for pv_move, expected_move in zip(pv, expected_moves.split()[1:]):
+    if pv_move.uci() != expected_move:
+      break
+    matched += 1
+  return matched
+
+def test_minimax_line_on_puzzle(puzzle_fen, expected_moves, max_time, max_depth=4, scheme="material_count"):
+  # Checks the whole solution line against the principal variation of a single search
+  board = chess.Board(puzzle_fen)
+  opponent_move = chess.Move.from_uci(expected_moves.split()[0])
+  if opponent_move not in board.legal_moves:
+    print(f"Invalid move in puzzle: {opponent_move}")
+    return 0, len(expected_moves.split()) - 1, 0
+
+  board.push(opponent_move)
+  start_time = time.time()
+  result = minimax_line_search(board, max_depth, max_time, scheme)
+  move_time = time.time() - start_time
+  return count_solution_moves(result.pv, expected_moves), len(expected_moves.split()) - 1, move_time
+
+def test_mcts_line_on_puzzle(puzzle_fen, expected_moves, max_time, scheme="material_count"):
+  # Plays the AI side of the whole solution line with one engine, so each search starts from the
+  # subtree kept from the previous one. Returns (solution moves found, moves in line, reused visits per move)
+  moves = expected_moves.split()
+  engine = MCTSEngine(scheme)
+  solved = 0
+  reused_visits = []
+  for ply in range(1, len(moves), 2):
+    engine.set_position(puzzle_fen, moves[:ply])
+    ai_move = engine.go(max_time)
+    reused_visits.append(engine.reused_visits)
+    if ai_move.uci() != moves[ply]:
+      break
+    solved += 1
+  return solved, len(moves) // 2, reused_visits
+
+def compare_minimax_search_options(puzzles_db, option_sets, max_depth=4, scheme="material_count"):
+  # Nodes-to-solution for each set of minimax_module.SearchOptions switches, e.g.
+  # {"baseline": {"pvs": False, "aspiration": False}, "pvs": {"aspiration": False}, "pvs+aspiration": {}}
+  results = {name: {"nodes": [], "success": []} for name in option_sets}
+  for puzzle in puzzles_db:
+    board = chess.Board(puzzle["FEN"])
+    moves = puzzle["Moves"].split()
+    board.push(chess.Move.from_uci(moves[0]))
+    for name, options in option_sets.items():
+      result = minimax_line_search(board, max_depth, None, scheme, **options)
+      results[name]["nodes"].append(result.nodes)
+      results[name]["success"].append(result.move is not None and result.move.uci() == moves[1])
+  return results
+
+def compare_mcts_parallel_strategies(puzzles_db, workers=4, scheme="material_count"):
+  # Success rate and playouts at equal time for serial MCTS and both parallel strategies
+  strategies = {"serial": (1, "tree"), "root": (workers, "root"), "tree": (workers, "tree")}
+  results = {name: {"playouts": [], "success": []} for name in strategies}
+  for puzzle in puzzles_db:
+    board = chess.Board(puzzle["FEN"])
+    moves = puzzle["Moves"].split()
+    board.push(chess.Move.from_uci(moves[0]))
+    max_time = get_max_time_for_puzzle(puzzle["Rating"])
+    for name, (num_workers, parallel) in strategies.items():
+      root = mcts_search(board, max_time, scheme, workers=num_workers, parallel=parallel)
+      best = best_child(root)
+      results[name]["playouts"].append(root.visits)
+      results[name]["success"].append(best.move.uci() == moves[1])
+  return results
+
+def compare_mcts_batch_sizes(puzzles_db, batch_sizes, max_playouts=2000, scheme="material_count"):
+  # Success rate and leaf positions evaluated per second for each MCTS leaf batch size
+  results = {size: {"positions_per_second": [], "success": []} for size in batch_sizes}
+  for puzzle in puzzles_db:
+    moves = puzzle["Moves"].split()
+    for size in batch_sizes:
+      engine = MCTSEngine(scheme, seed=0)
+      engine.set_position(puzzle["FEN"], moves[:1])
+      ai_move = engine.go(max_playouts=max_playouts, batch_size=size)
+      results[size]["positions_per_second"].append(engine.budget.positions_per_second())
+      results[size]["success"].append(ai_move.uci() == moves[1])
+  return results
+
+def benchmark_mcts_trees(fen, playouts=20000):
+  # Memory per visited node and tree operations (selection, expansion, backpropagation) per second
+  # for the object tree and the array tree; rollouts are replaced by a constant value
+  board = chess.Board(fen)
+  results = {}
+  for name in ("objects", "arrays"):
+    tracemalloc.start()
+    start_time = time.time()
+    if name == "objects":
+      root = Node()
+      for _ in range(playouts):
+        node, simulation_board, expanded = select_leaf(root, board)
+        backpropagate(node, 0.5, simulation_board.turn)
+    else:
+      tree = ArrayTree(capacity=64 * playouts)
+      for _ in range(playouts):
+        index, simulation_board, expanded = tree.select_leaf(board)
+        tree.backpropagate(index, 0.5, simulation_board.turn)
+    elapsed = time.time() - start_time
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    results[name] = {"bytes_per_node": memory / playouts, "playouts_per_second": playouts / elapsed}
+  return results
+
+def benchmark_evaluation_schemes(puzzles_db, schemes, repeat=10):
+  # Evaluations per second for each scheme over the puzzle positions, computed every time
+  # ("uncached") and through a fresh EvaluationCache, where all but the first pass are hits ("cached")
+  boards = [chess.Board(puzzle["FEN"]) for puzzle in puzzles_db]
+  results = {}
+  for scheme in schemes:
+    results[scheme] = {}
+    for name, cache in (("uncached", None), ("cached", EvaluationCache())):
+      start_time = time.time()
+      for _ in range(repeat):
+        for board in boards:
+          evaluate_board(board, scheme, cache=cache)
+      results[scheme][name] = repeat * len(boards) / (time.time() - start_time)
+  return results
+
+def check_batch_evaluation(puzzles_db, schemes):
+  # Compare evaluate_board_batch with evaluate_board on the puzzle positions:
+  # {scheme: (mismatches, batch evaluations per second, scalar evaluations per second)}
+  boards = [chess.Board(puzzle["FEN"]) for puzzle in puzzles_db]
+  results = {}
+  for scheme in schemes:
+    start_time = time.time()
+    batch = evaluate_board_batch(boards, scheme)
+    batch_rate = len(boards) / max(time.time() - start_time, 1e-9)
+    start_time = time.time()
+    scalar = [evaluate_board(board, scheme) for board in boards]
+    scalar_rate = len(boards) / max(time.time() - start_time, 1e-9)
+    mismatches = sum(1 for a, b in zip(batch.tolist(), scalar) if a != b)
+    results[scheme] = (mismatches, batch_rate, scalar_rate)
+  return results
+
 def evaluate_ai(puzzles_db, ai_type, max_depth=4, group_by_rating=False):
   rating_ranges = [(0, 1000), (1001, 1500), (1501, 2000), (2001, float('inf'))]
   if group_by_rating:
@@ -107,6 +264,7 @@ def evaluate_ai_with_schemes(puzzles_db, ai_type, schemes):
             success, _ = test_ai_on_puzzle(ai_type, puzzle["FEN"], puzzle["Moves"], get_max_time_for_puzzle(puzzle_rating), scheme=scheme)
             results[scheme]["success_rates"].append(int(success))
             results[scheme]["puzzle_ratings"].append(puzzle_rating)
+    print(f"Evaluation cache: {evaluation_cache.stats()}")
     return results
 
 def plot_ai_performance(results, ai_type):
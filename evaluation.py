@@ -1,6 +1,5 @@
 import chess
-from constants import PAWN_TABLE, KNIGHT_TABLE, BISHOP_TABLE, WHITE_SQUARES_MASK, BLACK_SQUARES_MASK
-from constants import ROOK_TABLE, QUEEN_TABLE, KING_TABLE
+from constants import PIECE_SQUARE_TABLES, WHITE_SQUARES_MASK, BLACK_SQUARES_MASK
 
 # Define piece values
 piece_values = {
@@ -46,41 +45,24 @@ def dynamic_reinforcement(board):
     return square_reinforcement
 
 # PIECE POSITION EVALUATION
+# The shared tables, with bishops only scored on their own colour's squares
+# (white bishops on WHITE_SQUARES_MASK, black bishops on BLACK_SQUARES_MASK)
+square_color_masks = {chess.WHITE: WHITE_SQUARES_MASK, chess.BLACK: BLACK_SQUARES_MASK}
+position_tables = [[list(table) for table in PIECE_SQUARE_TABLES[color]] for color in (chess.BLACK, chess.WHITE)]
+for color, mask in square_color_masks.items():
+    bishop_table = position_tables[color][chess.BISHOP - 1]
+    for square in range(64):
+        if not mask & (1 << square):
+            bishop_table[square] = 0
+
 def piece_position_evaluation(board):
     total_eval = 0
-
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            piece_type = piece.piece_type
-            piece_color = piece.color
-            row, col = divmod(square, 8)
-
-            # Determine the piece's base value and its position value from the table
-            if piece_type == chess.PAWN:
-                piece_value = PAWN_TABLE[row][col]
-            elif piece_type == chess.KNIGHT:
-                piece_value = KNIGHT_TABLE[row][col]
-            elif piece_type == chess.BISHOP:
-                piece_value = BISHOP_TABLE[row][col]
-                # Apply mask if you want to differentiate between white and black square bishops
-                if piece_color == chess.WHITE and not (WHITE_SQUARES_MASK & (1 << square)):
-                    piece_value = 0
-                elif piece_color == chess.BLACK and not (BLACK_SQUARES_MASK & (1 << square)):
-                    piece_value = 0
-            elif piece_type == chess.ROOK:
-                piece_value = ROOK_TABLE[row][col]
-            elif piece_type == chess.QUEEN:
-                piece_value = QUEEN_TABLE[row][col]
-            elif piece_type == chess.KING:
-                piece_value = KING_TABLE[row][col]
-
-            # Adjust the total evaluation based on the color of the piece
-            if piece_color == chess.WHITE:
-                total_eval += piece_value
-            else:
-                total_eval -= piece_value
-
+    for square, piece in board.piece_map().items():
+        piece_value = position_tables[piece.color][piece.piece_type - 1][square]
+        if piece.color == chess.WHITE:
+            total_eval += piece_value
+        else:
+            total_eval -= piece_value
     return total_eval
 
 # PAWN STRUCTURE EVALUATION
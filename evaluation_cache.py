@@ -0,0 +1,86 @@
+import chess
+from collections import OrderedDict
+
+# Memory of one cached result: the OrderedDict slot and link, the (board_key, name) tuple, its share
+# of the board_key tuple and bitboards, and the value. tracemalloc puts it at 200-280 bytes
+# depending on how many entries share a position and on the dict's fill; rounded up so a full
+# cache stays within size_mb.
+ENTRY_BYTES = 300
+
+
+def board_key(board):
+  """ The piece placement as a tuple of bitboards.
+
+  Evaluations only depend on where the pieces stand, so side to move, castling rights and the
+  en passant square are left out and positions differing only in those share cache entries.
+  The tuple itself is the key, so the dict compares positions exactly: a hash alone would let
+  distinct positions collide, and a Zobrist key built square by square in Python costs more than
+  most of the terms it would save. Entries of one position share the tuple.
+  """
+  return (board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+          board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK])
+
+
+class EvaluationCache:
+  """ Bounded LRU cache of evaluation results.
+
+  Entries are keyed by board_key plus the name of a scheme (a whole evaluation) or of a term
+  (one component of it), so schemes sharing a term reuse each other's work. Once more than
+  `size_mb` worth of entries is held the least recently used one is evicted. Lookups of whole
+  evaluations and of terms are counted separately.
+  """
+  def __init__(self, size_mb=16):
+    self.max_entries = max(1, int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+    self.entries = OrderedDict()
+    self.clear()
+
+  def clear(self):
+    self.entries.clear()
+    self.hits = 0
+    self.misses = 0
+    self.term_hits = 0
+    self.term_misses = 0
+    self.evictions = 0
+
+  def get(self, key, term=False):
+    """ The value cached for `key` (marking it recently used), or None. `term` counts the lookup
+    with the term lookups rather than the whole evaluations.
+    """
+    value = self.entries.get(key)
+    if value is None:
+      if term:
+        self.term_misses += 1
+      else:
+        self.misses += 1
+      return None
+    self.entries.move_to_end(key)
+    if term:
+      self.term_hits += 1
+    else:
+      self.hits += 1
+    return value
+
+  def put(self, key, value):
+    self.entries[key] = value
+    self.entries.move_to_end(key)
+    if len(self.entries) > self.max_entries:
+      self.entries.popitem(last=False)
+      self.evictions += 1
+
+  def stats(self):
+    """ Counters for reporting: entries held, capacity, evictions, and hits, misses and hit rate
+    of whole evaluations and of the terms looked up after an evaluation missed.
+    """
+    lookups = self.hits + self.misses
+    term_lookups = self.term_hits + self.term_misses
+    return {
+      'entries': len(self.entries),
+      'max_entries': self.max_entries,
+      'hits': self.hits,
+      'misses': self.misses,
+      'evictions': self.evictions,
+      'hit_rate': self.hits / lookups if lookups else 0.0,
+      'term_hits': self.term_hits,
+      'term_misses': self.term_misses,
+      'term_hit_rate': self.term_hits / term_lookups if term_lookups else 0.0
+    }
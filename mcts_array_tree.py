@@ -0,0 +1,328 @@
+import chess
+import random
+import numpy as np
+from mcts_module import C_PUCT, PW_BASE, PW_SCALE, PW_EXPONENT, VIRTUAL_LOSS, ROLLOUT_PLIES
+from mcts_module import SearchBudget, move_priors, play_rollout, rollout_values
+from time_manager import SearchTimeout
+from transposition_table import encode_move, decode_move
+
+INITIAL_CAPACITY = 1 << 12  # node slots allocated up front; doubled as the tree grows
+DEFAULT_CAPACITY = 1 << 20  # node slots before nodes are recycled
+MAX_MOVES = 256             # slots a recycle leaves free at least (218 legal moves at most)
+
+# Proven results are stored as codes; code / 2 is the reward, matching mcts_module's LOSS/DRAW/WIN
+UNPROVEN = -1
+LOSS_CODE = 0
+DRAW_CODE = 1
+WIN_CODE = 2
+
+# Struct of arrays: one array per node field
+FIELDS = (
+  ('visits', np.int32),
+  ('value_sum', np.float64),   # rewards for the side that played `move`
+  ('prior', np.float32),
+  ('move', np.uint16),         # transposition_table.encode_move
+  ('parent', np.int32),
+  ('first_child', np.int32),   # -1 until the node's moves are generated
+  ('num_children', np.int16),
+  ('num_expanded', np.int16),  # children visited so far, always a prefix of the block
+  ('proven', np.int8)
+)
+FIELD_DEFAULTS = {'parent': -1, 'first_child': -1, 'proven': UNPROVEN}
+BYTES_PER_NODE = sum(np.dtype(dtype).itemsize for _, dtype in FIELDS)
+
+
+class ArrayTree:
+  """ MCTS tree kept in preallocated NumPy arrays instead of one Python object per node.
+
+  Node 0 is the root. When selection first reaches a node, all of its moves are stored at once as
+  a contiguous child block sorted by prior (first_child, num_children); progressive widening
+  visits a growing prefix of the block (num_expanded), so no untried-move lists are kept.
+
+  The arrays grow by doubling up to `capacity` slots. Once that is full the tree is recycled:
+  subtrees under rarely visited nodes are dropped and the rest is compacted (see recycle).
+  """
+  def __init__(self, capacity=DEFAULT_CAPACITY):
+    self.capacity = max(capacity, 2 * MAX_MOVES)
+    self.size = 1
+    self.recycles = 0
+    self.resize(min(INITIAL_CAPACITY, self.capacity))
+    self.prior[0] = 1.0
+
+  def empty_fields(self, length):
+    return {name: np.full(length, FIELD_DEFAULTS.get(name, 0), dtype) for name, dtype in FIELDS}
+
+  def resize(self, length):
+    fields = self.empty_fields(length)
+    for name, _ in FIELDS:
+      if hasattr(self, name):
+        fields[name][:self.size] = getattr(self, name)[:self.size]
+      setattr(self, name, fields[name])
+
+  def nbytes(self):
+    return sum(getattr(self, name).nbytes for name, _ in FIELDS)
+
+  def has_room(self, slots):
+    """ True if `slots` new nodes fit, growing the arrays if needed. False once only recycling can
+    make room; that moves nodes, so it is left to the caller between playouts.
+    """
+    length = len(self.visits)
+    if self.size + slots > length and length < self.capacity:
+      self.resize(min(self.capacity, max(2 * length, self.size + slots)))
+    return self.size + slots <= len(self.visits)
+
+  def recycle(self, slots):
+    """ Drop the child blocks of nodes with fewer than 2, 4, 8, ... visits until at most half the
+    capacity (and at least `slots` free) remains in use. Those nodes keep their own statistics and
+    regenerate their children if selection reaches them again.
+    """
+    min_visits = 2
+    while True:
+      self.compact(min_visits)
+      if self.size <= max(1, min(self.capacity // 2, self.capacity - slots)):
+        break
+      min_visits *= 2
+    self.recycles += 1
+
+  def compact(self, min_visits):
+    old = {name: getattr(self, name) for name, _ in FIELDS}
+    new = self.empty_fields(len(self.visits))
+    for name, _ in FIELDS:
+      new[name][0] = old[name][0]
+    size = 1
+    stack = [(0, 0)]
+    while stack:
+      old_index, new_index = stack.pop()
+      first, count = old['first_child'][old_index], old['num_children'][old_index]
+      if first < 0 or count == 0:
+        continue
+      if old['visits'][old_index] < min_visits:
+        new['first_child'][new_index] = -1
+        new['num_children'][new_index] = 0
+        new['num_expanded'][new_index] = 0
+        continue
+      for name, _ in FIELDS:
+        new[name][size:size + count] = old[name][first:first + count]
+      new['parent'][size:size + count] = new_index
+      new['first_child'][new_index] = size
+      # Only visited children can have child blocks of their own
+      stack.extend((first + k, size + k) for k in range(old['num_expanded'][old_index]))
+      size += count
+    for name, _ in FIELDS:
+      setattr(self, name, new[name])
+    self.size = size
+
+  def init_children(self, index, board):
+    """ Store all moves of `index`'s position as its child block, best prior first. Returns False,
+    storing nothing, when the block does not fit (see has_room).
+    """
+    moves = list(board.generate_legal_moves())
+    if not self.has_room(len(moves)):
+      return False
+    order = sorted(zip(move_priors(board, moves), moves), key=lambda entry: -entry[0])
+    first = self.size
+    count = len(order)
+    self.size += count
+    self.prior[first:first + count] = [prior for prior, _ in order]
+    self.move[first:first + count] = [encode_move(move) for _, move in order]
+    self.parent[first:first + count] = index
+    self.first_child[index] = first
+    self.num_children[index] = count
+    return True
+
+  def mark_terminal(self, index, board):
+    if not any(board.generate_legal_moves()):
+      self.proven[index] = WIN_CODE if board.is_check() else DRAW_CODE
+      self.first_child[index] = self.size  # an empty child block
+    elif board.is_insufficient_material():
+      self.proven[index] = DRAW_CODE
+
+  def can_widen(self, index, first, expanded):
+    """ Progressive widening as in mcts_module.Node.can_expand, for the block prefix. """
+    limit = PW_BASE + PW_SCALE * self.visits[index] ** PW_EXPONENT
+    if expanded < limit:
+      return True
+    return expanded - np.count_nonzero(self.proven[first:first + expanded] == LOSS_CODE) < limit
+
+  def select_child(self, index, first, expanded):
+    """ PUCT over the visited children, as mcts_module.Node.select_child, in one vector step. """
+    end = first + expanded
+    visits = self.visits[first:end]
+    values = self.value_sum[first:end] / np.maximum(visits, 1)
+    proven = self.proven[first:end]
+    known = proven != UNPROVEN
+    if known.any():
+      values = np.where(known, proven / 2, values)
+    scores = values + C_PUCT * np.sqrt(self.visits[index]) * self.prior[first:end] / (1 + visits)
+    if known.any():
+      scores[proven == LOSS_CODE] = -1.0
+    return first + int(np.argmax(scores))
+
+  def select_leaf(self, board, solver=True):
+    """ Selection and expansion, as mcts_module.select_leaf. Returns (leaf index, its position,
+    whether it was just expanded), or None with the tree unchanged when it must be recycled first.
+    """
+    index = 0
+    simulation_board = board.copy()
+    if self.first_child[0] < 0 and not self.init_children(0, simulation_board):
+      return None
+
+    while self.proven[index] == UNPROVEN:
+      first = int(self.first_child[index])
+      count = int(self.num_children[index])
+      expanded = int(self.num_expanded[index])
+      if expanded < count and self.can_widen(index, first, expanded):
+        # Expansion - visit the next child of the block by prior
+        child = first + expanded
+        self.num_expanded[index] = expanded + 1
+        simulation_board.push(decode_move(int(self.move[child])))
+        if solver:
+          self.mark_terminal(child, simulation_board)
+        return child, simulation_board, True
+      if expanded == 0:
+        break
+      index = self.select_child(index, first, expanded)
+      simulation_board.push(decode_move(int(self.move[index])))
+      if self.first_child[index] < 0 and not self.init_children(index, simulation_board):
+        return None
+    return index, simulation_board, False
+
+  def leaf_value(self, index, leaf_turn):
+    reward = self.proven[index] / 2
+    return reward if leaf_turn == chess.BLACK else 1 - reward
+
+  def abandon_leaf(self, index, expanded):
+    if expanded:
+      parent = self.parent[index]
+      if index == self.first_child[parent] + self.num_expanded[parent] - 1:
+        self.num_expanded[parent] -= 1
+
+  def add_virtual_loss(self, index):
+    # With value sums a virtual loss is just a visit without reward
+    while index >= 0:
+      self.visits[index] += VIRTUAL_LOSS
+      index = self.parent[index]
+
+  def remove_virtual_loss(self, index):
+    while index >= 0:
+      self.visits[index] -= VIRTUAL_LOSS
+      index = self.parent[index]
+
+  def backpropagate(self, index, value, leaf_turn, solver=True):
+    """ Single pass to the root, as mcts_module.backpropagate. """
+    reward = value if leaf_turn == chess.BLACK else 1 - value
+    proving = solver and self.proven[index] != UNPROVEN
+    while index >= 0:
+      self.visits[index] += 1
+      self.value_sum[index] += reward
+      if proving:
+        proving = self.prove_parent(index)
+      reward = 1 - reward
+      index = self.parent[index]
+
+  def prove_parent(self, child):
+    """ MCTS-Solver step, as mcts_module.prove_parent. """
+    parent = self.parent[child]
+    if parent < 0 or self.proven[parent] != UNPROVEN:
+      return False
+    if self.proven[child] == WIN_CODE:
+      self.proven[parent] = LOSS_CODE
+      return True
+    first, count = self.first_child[parent], self.num_children[parent]
+    proven = self.proven[first:first + count]
+    if self.num_expanded[parent] < count or (proven == UNPROVEN).any():
+      return False
+    self.proven[parent] = WIN_CODE if (proven == LOSS_CODE).all() else DRAW_CODE
+    return True
+
+  def root_children(self):
+    first = int(self.first_child[0])
+    return range(first, first + int(self.num_expanded[0]))
+
+  def best_child(self):
+    """ As mcts_module.best_child: a proven win, else the most visited child not proven lost, else
+    the highest-prior child.
+    """
+    if self.num_expanded[0] == 0 and self.num_children[0] > 0:
+      return int(self.first_child[0])
+    return max(self.root_children(), key=lambda child: (self.proven[child] == WIN_CODE,
+                                                        self.proven[child] != LOSS_CODE, self.visits[child]))
+
+  def best_move(self):
+    return decode_move(int(self.move[self.best_child()]))
+
+  def best_move_decided(self, budget):
+    """ As mcts_module.best_move_decided. """
+    if self.proven[0] != UNPROVEN:
+      return True
+    if self.num_children[0] == 1 and self.num_expanded[0] == 1:
+      return True
+    remaining_playouts = budget.remaining_playouts()
+    if remaining_playouts is None or budget.playouts == 0:
+      return False
+    visits = sorted((int(self.visits[child]) for child in self.root_children()), reverse=True) + [0, 0]
+    return visits[0] - visits[1] > remaining_playouts
+
+
+def run_array_simulations(tree, board, max_time=None, scheme='material_count', budget=None,
+                          rollout_plies=ROLLOUT_PLIES, rng=random, batch_size=1, solver=True):
+  """ mcts_module.run_simulations for an ArrayTree. budget.nodes reports the slots in use; the
+  tree's capacity, not the budget, bounds its memory.
+  """
+  if budget is None:
+    budget = SearchBudget(max_time=max_time)
+  budget.arm(tree.visits[0])
+  timed_out = False
+
+  while not timed_out and not budget.exhausted() and tree.proven[0] == UNPROVEN:
+    leaves = []
+    positions = []
+    while len(leaves) < batch_size and not budget.exhausted(len(leaves)):
+      leaf = tree.select_leaf(board, solver)
+      if leaf is None:
+        # Recycling moves nodes, so the pending playouts are backed up first
+        if leaves:
+          break
+        tree.recycle(MAX_MOVES)
+        continue
+      index, simulation_board, expanded = leaf
+      leaf_turn = simulation_board.turn
+      if tree.proven[index] != UNPROVEN:
+        if batch_size > 1:
+          tree.add_virtual_loss(index)
+        leaves.append((index, leaf_turn, True))
+        continue
+      try:
+        play_rollout(simulation_board, budget.timer, rollout_plies, rng)
+      except SearchTimeout:
+        tree.abandon_leaf(index, expanded)
+        timed_out = True
+        break
+      if batch_size > 1:
+        tree.add_virtual_loss(index)
+      leaves.append((index, leaf_turn, False))
+      positions.append(simulation_board)
+
+    values = iter(rollout_values(positions, scheme))
+    budget.evaluations += len(positions)
+    for index, leaf_turn, proven in leaves:
+      if batch_size > 1:
+        tree.remove_virtual_loss(index)
+      tree.backpropagate(index, tree.leaf_value(index, leaf_turn) if proven else next(values), leaf_turn, solver)
+    budget.playouts += len(leaves)
+    budget.nodes = tree.size
+    budget.arm(tree.visits[0])
+
+    if tree.best_move_decided(budget):
+      break
+
+  return budget
+
+def array_search(board, max_time=None, scheme='material_count', rollout_plies=ROLLOUT_PLIES, max_playouts=None,
+                 capacity=DEFAULT_CAPACITY, seed=None, batch_size=1, solver=True):
+  """ Run a search on a new ArrayTree and return the tree. """
+  tree = ArrayTree(capacity)
+  budget = SearchBudget(max_playouts, None, max_time)
+  run_array_simulations(tree, board, scheme=scheme, budget=budget, rollout_plies=rollout_plies,
+                        rng=random.Random(seed), batch_size=batch_size, solver=solver)
+  return tree
@@ -1,107 +1,651 @@
 import chess
 import random
 import math
-import time
+import multiprocessing
+import queue
 from board_evaluation_functions import evaluate_board
+from evaluation_cache import EvaluationCache
+from batch_evaluation import evaluate_board_batch
+from constants import PAWN_VALUE, KNIGHT_VALUE, BISHOP_VALUE, ROOK_VALUE, QUEEN_VALUE
+from constants import PIECE_SQUARE_TABLES
+from time_manager import TimeManager, SearchTimeout
+
+# SELECTION - PUCT with move priors, and progressive widening: a node may only have
+# PW_BASE + PW_SCALE * visits ** PW_EXPONENT children, expanded in prior order
+C_PUCT = 1.5
+PW_BASE = 2
+PW_SCALE = 1.0
+PW_EXPONENT = 0.5
+
+# MCTS-SOLVER - proven results, as the exact reward for the side that moved into the node
+WIN = 1.0
+DRAW = 0.5
+LOSS = 0.0
 
 class Node:
-  def __init__(self, move=None, parent=None, board=None):
+  """ Search tree node. Nodes hold no board: a node's position is rebuilt by replaying the moves
+  from the root, and its untried moves are only generated once selection reaches it.
+  """
+  __slots__ = ('move', 'parent', 'children', 'value', 'visits', 'untried_moves', 'prior', 'proven')
+
+  def __init__(self, move=None, parent=None, prior=1.0):
     self.move = move
     self.parent = parent
-    self.board = board
     self.children = []
-    self.wins = 0
+    self.value = 0.0  # mean reward for the side that played `move`
     self.visits = 0
-    self.untried_moves = list(board.legal_moves) if board else []
+    self.untried_moves = None  # (prior, move) pairs, best prior last
+    self.prior = prior
+    self.proven = None  # WIN, DRAW or LOSS once the result is known
+
+  def init_moves(self, board):
+    """ Generate the untried moves from this node's position, with their priors, the first time it is reached. """
+    if self.untried_moves is None:
+      moves = list(board.generate_legal_moves())
+      self.untried_moves = sorted(zip(move_priors(board, moves), moves), key=lambda entry: entry[0])
+
+  def can_expand(self):
+    """ True while there are untried moves and progressive widening allows another child.
+    Children proven lost don't count towards the limit.
+    """
+    if self.untried_moves == []:
+      return False
+    limit = PW_BASE + PW_SCALE * self.visits ** PW_EXPONENT
+    return len(self.children) < limit or \
+      len(self.children) - sum(child.proven == LOSS for child in self.children) < limit
 
   def select_child(self):
-    """ Select a child node with the highest UCB1 value. """
-    c = 1.41  # Exploration parameter starts at \sqrt{2} -- common for 2-player games like chess
+    """ Select a child node with the highest PUCT value, skipping children proven lost while
+    there are others. Proven children are valued at their exact result.
+    """
+    exploration = C_PUCT * math.sqrt(self.visits)
     best_value = -float('inf')
     best_node = None
     for child in self.children:
-      ucb1 = child.wins / child.visits + c * math.sqrt(math.log(self.visits) / child.visits)
-      if ucb1 > best_value:
-        best_value = ucb1
+      if child.proven == LOSS:
+        puct = -1.0
+      else:
+        value = child.value if child.proven is None else child.proven
+        puct = value + exploration * child.prior / (1 + child.visits)
+      if puct > best_value:
+        best_value = puct
         best_node = child
     return best_node
 
-  def add_child(self, move):
-    """ Add a new child node for the move. """
-    new_board = self.board.copy()
-    new_board.push(move)
-    new_node = Node(move=move, parent=self, board=new_board)
+  def expand(self):
+    """ Add a child node for the untried move with the highest prior. """
+    prior, move = self.untried_moves.pop()
+    new_node = Node(move=move, parent=self, prior=prior)
     self.children.append(new_node)
-    self.untried_moves.remove(move)
     return new_node
 
-def simulate_game_with_evaluation(node, board, scheme):
-  while not board.is_game_over():
-    best_move = None
-    best_eval = -float('inf') if board.turn == chess.WHITE else float('inf')
-
-    for move in board.legal_moves:
-      board.push(move)
-      evaluation = evaluate_board(board, scheme=scheme)
-      if (board.turn == chess.WHITE and evaluation > best_eval) or \
-        (board.turn == chess.BLACK and evaluation < best_eval):
-          best_eval = evaluation
-          best_move = move
-      board.pop()
-
-    if (board.turn == chess.WHITE and evaluation > best_eval) or \
-      (board.turn == chess.BLACK and evaluation < best_eval):
-      best_eval = evaluation
-      best_move = move
-
-    board.push(best_move if best_move else random.choice(list(board.legal_moves)))
-
-
-def select_best_move(board, max_time=None, scheme='material_count'):
-  root = Node(board=board)
-  start_time = time.time()
-
-  while 1000: # Number of simulations (adjust based on performance)
-    node = root
-    simulation_board = board.copy()
-
-    # Selection - UCB1 formula
-    #           - Use evaluation function for the rollout phase, if not purely random
-    while node.untried_moves == [] and node.children != []:
-      node = node.select_child()
-      simulation_board.push(node.move)
-
-    # Expansion - expand leaf node by adding all possible next moves as its children
-    #           - Use board state to generate possible moves
-    if node.untried_moves != []:
-      move = random.choice(node.untried_moves)
-      node = node.add_child(move)
-      simulation_board.push(move)
-
-    # Simulation - From a new node, simulate a random game and get the result
-    simulate_game_with_evaluation(node, simulation_board, scheme)
-
-    # Back Propagation - Update the node and its ancestors with the result of the simulation
-    while node is not None:
-      node.visits += 1
-      if simulation_board.result() == '1-0':
-        # Increase win count for White
-        temp_node = node
-        while temp_node is not None:
-          if temp_node.board.turn == chess.WHITE:
-            temp_node.wins += 1
-          temp_node = temp_node.parent
-      elif simulation_board.result() == '0-1':
-          # Increase win count for Black
-          temp_node = node
-          while temp_node is not None:
-            if temp_node.board.turn == chess.BLACK:
-              temp_node.wins += 1
-            temp_node = temp_node.parent
-      node = node.parent
-    
-    # If time limit exceeded, break the loop
-    if max_time is not None and (time.time() - start_time) > max_time:
+  def update(self, reward):
+    """ Add one playout's reward (in [0, 1]) to the running mean. """
+    self.visits += 1
+    self.value += (reward - self.value) / self.visits
+
+# ROLLOUT POLICY - play a few cheap greedy plies, then score the position with the evaluation
+
+ROLLOUT_PLIES = 6     # ply cap for a playout
+ROLLOUT_SCALE = 400   # centipawns for a 10:1 win expectancy, as in the Elo formula
+BATCH_EVALUATION_MIN = 32  # batches from this size up are scored by evaluate_board_batch
+
+rollout_piece_values = {
+  chess.PAWN: PAWN_VALUE,
+  chess.KNIGHT: KNIGHT_VALUE,
+  chess.BISHOP: BISHOP_VALUE,
+  chess.ROOK: ROOK_VALUE,
+  chess.QUEEN: QUEEN_VALUE,
+  chess.KING: 0
+}
+
+def pst_value(piece_type, color, square):
+  """ Piece-square bonus of a piece of `color` on `square`. """
+  return PIECE_SQUARE_TABLES[color][piece_type - 1][square]
+
+def move_delta(board, move):
+  """ Cheap gain of a move for the side making it - material won plus the piece-square change -
+  computed from the board as it is, without pushing the move.
+  """
+  piece_type = board.piece_type_at(move.from_square)
+  if board.is_en_passant(move):
+    gain = PAWN_VALUE
+  else:
+    gain = rollout_piece_values[board.piece_type_at(move.to_square) or chess.KING]
+  if move.promotion:
+    gain += rollout_piece_values[move.promotion] - PAWN_VALUE
+    return gain + pst_value(move.promotion, board.turn, move.to_square) - pst_value(piece_type, board.turn, move.from_square)
+  return gain + pst_value(piece_type, board.turn, move.to_square) - pst_value(piece_type, board.turn, move.from_square)
+
+PRIOR_TEMPERATURE = 100  # centipawns of move score per factor e in prior odds
+CHECK_PRIOR_BONUS = 150   # centipawns added to the score of a checking move
+
+def move_priors(board, moves):
+  """ Softmax over a cheap move score (material won, piece-square change, check bonus). """
+  scores = [move_delta(board, move) + (CHECK_PRIOR_BONUS if board.gives_check(move) else 0) for move in moves]
+  if not scores:
+    return []
+  best = max(scores)
+  weights = [math.exp((score - best) / PRIOR_TEMPERATURE) for score in scores]
+  total = sum(weights)
+  return [weight / total for weight in weights]
+
+def rollout_value(board, scheme, eval_cache=None):
+  """ White's expected score in [0, 1]: exact for finished games, else a logistic of the evaluation. """
+  if board.is_checkmate():
+    return 0.0 if board.turn == chess.WHITE else 1.0
+  if board.is_stalemate() or board.is_insufficient_material():
+    return 0.5
+  return 1 / (1 + 10 ** (-evaluate_board(board, scheme=scheme, check_draw=False, cache=eval_cache) / ROLLOUT_SCALE))
+
+def rollout_values(boards, scheme, eval_cache=None):
+  """ rollout_value for a batch of positions; the positions still in play are scored by a single
+  evaluate_positions call.
+  """
+  values = [None] * len(boards)
+  pending = []
+  for i, board in enumerate(boards):
+    if board.is_checkmate() or board.is_stalemate() or board.is_insufficient_material():
+      values[i] = rollout_value(board, scheme)
+    else:
+      pending.append(i)
+  scores = evaluate_positions([boards[i] for i in pending], scheme, eval_cache)
+  for i, score in zip(pending, scores):
+    values[i] = 1 / (1 + 10 ** (-score / ROLLOUT_SCALE))
+  return values
+
+def evaluate_positions(boards, scheme, eval_cache=None):
+  """ White-relative evaluations of a batch of positions. Large batches are scored at once by
+  the vectorized evaluator; below BATCH_EVALUATION_MIN its NumPy overhead costs more than it saves,
+  and the positions are scored one by one through `eval_cache`.
+  """
+  if len(boards) >= BATCH_EVALUATION_MIN:
+    return evaluate_board_batch(boards, scheme, check_draw=False).tolist()
+  return [evaluate_board(board, scheme=scheme, check_draw=False, cache=eval_cache) for board in boards]
+
+def play_rollout(board, timer=None, max_plies=ROLLOUT_PLIES, rng=random):
+  """ Play up to `max_plies` greedy moves by move_delta (ties broken at random) on `board`. """
+  for _ in range(max_plies):
+    if timer is not None:
+      timer.check()
+    moves = list(board.generate_legal_moves())
+    if not moves or board.is_insufficient_material():
       break
+    board.push(max(moves, key=lambda move: move_delta(board, move) + rng.random()))
+
+def simulate_game_with_evaluation(board, scheme, timer=None, max_plies=ROLLOUT_PLIES, rng=random):
+  """ Play a greedy rollout from `board` and return rollout_value of the final position. """
+  play_rollout(board, timer, max_plies, rng)
+  return rollout_value(board, scheme)
+
+# SEARCH BUDGET
+
+DEFAULT_PLAYOUTS = 1000  # used when no limit at all is given
+
+class SearchBudget:
+  """ Stop conditions for one search: playouts, tree nodes and wall time, whichever runs out first.
+  With no limit given the search stops after DEFAULT_PLAYOUTS playouts.
+
+  Playout and node budgets make a search independent of machine load: with a fixed seed and no
+  max_time, a serial search is fully reproducible.
+
+  No limit applies before the root has a backed-up playout (see arm), so the first playout always
+  finishes and a search always has a move to return.
+  """
+  def __init__(self, max_playouts=None, max_nodes=None, max_time=None):
+    if max_playouts is None and max_nodes is None and max_time is None:
+      max_playouts = DEFAULT_PLAYOUTS
+    self.max_playouts = max_playouts
+    self.max_nodes = max_nodes
+    self.timer = TimeManager(max_time, max_time, check_every=1)
+    self.playouts = 0
+    self.nodes = 0
+    self.evaluations = 0
+
+  def positions_per_second(self):
+    """ Leaf positions evaluated per second of search so far. """
+    elapsed = self.timer.elapsed()
+    return self.evaluations / elapsed if elapsed > 0 else 0.0
+
+  def split(self, parts):
+    """ Budget for one of `parts` independent searches sharing this one. """
+    share = lambda limit: None if limit is None else max(1, limit // parts)
+    return SearchBudget(share(self.max_playouts), share(self.max_nodes), self.timer.hard_limit)
+
+  def arm(self, root_visits):
+    """ Enforce the limits, the hard deadline included, once the root has been visited. """
+    self.timer.anytime = root_visits > 0
+
+  def exhausted(self, pending=0):
+    """ True once any limit is reached, counting `pending` playouts still in flight. """
+    if pending == 0 and not self.timer.anytime:
+      return False
+    if self.max_playouts is not None and self.playouts + pending >= self.max_playouts:
+      return True
+    if self.max_nodes is not None and self.nodes >= self.max_nodes:
+      return True
+    return self.timer.soft_expired()
+
+  def remaining_playouts(self):
+    """ Most playouts the search can still run, or None if that is unbounded. Every playout
+    expands at most one node, so the node budget bounds it too.
+    """
+    bounds = []
+    if self.max_playouts is not None:
+      bounds.append(self.max_playouts - self.playouts)
+    if self.max_nodes is not None:
+      bounds.append(self.max_nodes - self.nodes)
+    elapsed = self.timer.elapsed()
+    if self.timer.hard_limit is not None and self.playouts and elapsed > 0:
+      bounds.append(self.playouts / elapsed * (self.timer.hard_limit - elapsed))
+    return min(bounds) if bounds else None
+
+def count_nodes(root):
+  count = 0
+  stack = [root]
+  while stack:
+    node = stack.pop()
+    count += 1
+    stack.extend(node.children)
+  return count
+
+
+def select_best_move(board, max_time=None, scheme='material_count', rollout_plies=ROLLOUT_PLIES, workers=1,
+                     parallel='tree', max_playouts=None, max_nodes=None, seed=None, batch_size=1, solver=True,
+                     tree='objects'):
+  """ Most visited root move (a proven win if the solver found one).
+
+  The search stops at max_time seconds, max_playouts playouts or max_nodes tree nodes, whichever
+  comes first (DEFAULT_PLAYOUTS playouts if none is given); `seed` makes the playouts reproducible.
+  With workers > 1 playouts run in a process pool, using either parallel='tree' (one shared tree,
+  virtual loss) or parallel='root' (independent trees merged). With batch_size > 1 a serial search
+  scores leaves in batches (see run_simulations). With `solver` wins, losses and draws proven in
+  the tree are propagated up (see backpropagate), and a proven root ends the search.
+
+  tree='arrays' runs the same search serially on a mcts_array_tree.ArrayTree, for searches too
+  large for a Python object per node; there max_nodes is the tree's capacity, reached by
+  recycling nodes rather than by stopping.
+  """
+  if tree == 'arrays':
+    from mcts_array_tree import array_search, DEFAULT_CAPACITY
+    if workers > 1:
+      raise ValueError("The array tree only supports serial search")
+    return array_search(board, max_time, scheme, rollout_plies, max_playouts, max_nodes or DEFAULT_CAPACITY, seed,
+                        batch_size, solver).best_move()
+  if tree != 'objects':
+    raise ValueError("Unknown MCTS tree store: " + tree)
+  root = mcts_search(board, max_time, scheme, rollout_plies, workers, parallel, max_playouts, max_nodes, seed,
+                     batch_size, solver)
+  return best_child(root).move
+
+def mcts_search(board, max_time=None, scheme='material_count', rollout_plies=ROLLOUT_PLIES, workers=1,
+                parallel='tree', max_playouts=None, max_nodes=None, seed=None, batch_size=1, solver=True):
+  """ Run a search and return its root node. """
+  root = Node()
+  budget = SearchBudget(max_playouts, max_nodes, max_time)
+  rng = random.Random(seed)
+  if workers <= 1:
+    run_simulations(root, board, scheme=scheme, budget=budget, rollout_plies=rollout_plies, rng=rng,
+                    batch_size=batch_size, solver=solver)
+  elif parallel == 'tree':
+    run_tree_parallel(root, board, scheme=scheme, workers=workers, budget=budget, rollout_plies=rollout_plies,
+                      rng=rng, solver=solver)
+  elif parallel == 'root':
+    root = run_root_parallel(board, scheme=scheme, workers=workers, budget=budget, rollout_plies=rollout_plies,
+                             rng=rng, solver=solver)
+  else:
+    raise ValueError("Unknown parallel MCTS strategy: " + parallel)
+  return root
+
+def best_child(root):
+  """ Root child to play: a proven win, else the most visited child not proven lost. Before any
+  child is visited, an unattached child for the highest-prior move.
+  """
+  if not root.children and root.untried_moves:
+    prior, move = root.untried_moves[-1]
+    return Node(move, root, prior)
+  return max(root.children, key=lambda child: (child.proven == WIN, child.proven != LOSS, child.visits))
+
+def best_move_decided(root, budget):
+  """ True when the root is proven, or the most visited root move can no longer be overtaken
+  within the budget left.
+  """
+  if root.proven is not None:
+    return True
+  if not root.untried_moves and len(root.children) == 1:
+    return True  # only one legal move
+  remaining_playouts = budget.remaining_playouts()
+  if remaining_playouts is None or budget.playouts == 0:
+    return False
+  visits = sorted((child.visits for child in root.children), reverse=True) + [0, 0]
+  return visits[0] - visits[1] > remaining_playouts
+
+def select_leaf(root, board, solver=True):
+  """ Selection and expansion. Returns (leaf node, its position, whether it was just expanded).
+  Selection stops at proven nodes; with `solver` a new node that ends the game is marked proven.
+  """
+  node = root
+  simulation_board = board.copy()
+  node.init_moves(simulation_board)
+
+  # Selection - PUCT formula, replaying the moves on the way down to rebuild the position
+  #           - descend until a node may be widened, or a leaf is reached
+  while node.proven is None and node.children != [] and not node.can_expand():
+    node = node.select_child()
+    simulation_board.push(node.move)
+    node.init_moves(simulation_board)
+
+  # Expansion - add the best untried move by prior as a new child
+  expanded = False
+  if node.proven is None and node.untried_moves != []:
+    node = node.expand()
+    simulation_board.push(node.move)
+    expanded = True
+    if solver:
+      mark_terminal(node, simulation_board)
+  return node, simulation_board, expanded
+
+def mark_terminal(node, board):
+  if not any(board.generate_legal_moves()):
+    node.proven = WIN if board.is_check() else DRAW
+    node.untried_moves = []
+  elif board.is_insufficient_material():
+    node.proven = DRAW
+
+def leaf_value(node, leaf_turn):
+  """ White's score at a proven node, in the form backpropagate takes. """
+  return node.proven if leaf_turn == chess.BLACK else 1 - node.proven
+
+def abandon_leaf(node, expanded):
+  """ Undo an expansion whose playout never finished, so the tree never holds an unvisited child. """
+  if expanded:
+    node.parent.children.remove(node)
+    node.parent.untried_moves.append((node.prior, node.move))
+
+def backpropagate(node, value, leaf_turn, solver=True):
+  """ Back Propagation - one pass from the leaf to the root. `value` is White's expected score;
+  each node is credited from the side that moved into it, so the reward flips every ply.
+  With `solver` a proven leaf also tries to prove its ancestors on the way up (see prove_parent).
+  """
+  reward = value if leaf_turn == chess.BLACK else 1 - value
+  proving = solver and node.proven is not None
+  while node is not None:
+    node.update(reward)
+    if proving:
+      proving = prove_parent(node)
+    reward = 1 - reward
+    node = node.parent
+
+def prove_parent(child):
+  """ Prove `child`'s parent from its children, returning True if it became proven: one child
+  won for the side to move proves it lost for the side that moved into it; once every move is
+  expanded and proven, all lost proves it won and otherwise it is a draw.
+  """
+  parent = child.parent
+  if parent is None or parent.proven is not None:
+    return False
+  if child.proven == WIN:
+    parent.proven = LOSS
+    return True
+  if parent.untried_moves != [] or any(sibling.proven is None for sibling in parent.children):
+    return False
+  if all(sibling.proven == LOSS for sibling in parent.children):
+    parent.proven = WIN
+  else:
+    parent.proven = DRAW
+  return True
+
+VIRTUAL_LOSS = 1  # visits added along a path while its playout is in flight
+
+def add_virtual_loss(node):
+  # Pending visits counted as losses make the path look worse, steering other selections elsewhere
+  while node is not None:
+    node.visits += VIRTUAL_LOSS
+    node.value *= (node.visits - VIRTUAL_LOSS) / node.visits
+    node = node.parent
+
+def remove_virtual_loss(node):
+  while node is not None:
+    node.visits -= VIRTUAL_LOSS
+    node.value = node.value * (node.visits + VIRTUAL_LOSS) / node.visits if node.visits else 0.0
+    node = node.parent
+
+def run_simulations(root, board, max_time=None, scheme='material_count', budget=None, rollout_plies=ROLLOUT_PLIES,
+                    rng=random, batch_size=1, solver=True, eval_cache=None):
+  """ Grow the tree under `root` (whose position is `board`) until the budget runs out.
+
+  Each step selects `batch_size` leaves, keeping virtual loss on the pending ones so the batch
+  spreads over different lines, plays their rollouts and scores the final positions with one
+  rollout_values call. budget.positions_per_second() reports the evaluation throughput.
+
+  The clock is checked every rollout ply, so an unfinished playout is dropped at the deadline; the
+  first one always finishes (see SearchBudget).
+  Returns the SearchBudget; its timer's overshoot() reports how far past max_time the search ran.
+  """
+  if budget is None:
+    budget = SearchBudget(max_time=max_time)
+  budget.nodes = count_nodes(root)
+  budget.arm(root.visits)
+  timed_out = False
+
+  while not timed_out and not budget.exhausted() and root.proven is None:
+    leaves = []
+    positions = []
+    while len(leaves) < batch_size and not budget.exhausted(len(leaves)):
+      node, simulation_board, expanded = select_leaf(root, board, solver)
+      leaf_turn = simulation_board.turn
+      budget.nodes += expanded
+
+      # A proven node needs no playout: its exact result is backed up
+      if node.proven is not None:
+        if batch_size > 1:
+          add_virtual_loss(node)
+        leaves.append((node, leaf_turn, True))
+        continue
+
+      # Simulation - From a new node, play a short greedy rollout; it is scored with the batch
+      try:
+        play_rollout(simulation_board, budget.timer, rollout_plies, rng)
+      except SearchTimeout:
+        abandon_leaf(node, expanded)
+        budget.nodes -= expanded
+        timed_out = True
+        break
+      if batch_size > 1:
+        add_virtual_loss(node)
+      leaves.append((node, leaf_turn, False))
+      positions.append(simulation_board)
+
+    values = iter(rollout_values(positions, scheme, eval_cache))
+    budget.evaluations += len(positions)
+    for node, leaf_turn, proven in leaves:
+      if batch_size > 1:
+        remove_virtual_loss(node)
+      backpropagate(node, leaf_value(node, leaf_turn) if proven else next(values), leaf_turn, solver)
+    budget.playouts += len(leaves)
+    budget.arm(root.visits)
+
+    # Stop early once the best root move can't change
+    if best_move_decided(root, budget):
+      break
+
+  return budget
+
+# PARALLEL MCTS
+
+# Per-process state of a rollout worker, set once by init_rollout_worker
+rollout_worker = {}
+
+def init_rollout_worker(board, scheme, rollout_plies):
+  rollout_worker['board'] = board
+  rollout_worker['scheme'] = scheme
+  rollout_worker['rollout_plies'] = rollout_plies
+
+def rollout_task(path, seed):
+  """ Rollout value of the position reached by playing `path` from the worker's root. """
+  board = rollout_worker['board'].copy()
+  for move in path:
+    board.push(move)
+  return simulate_game_with_evaluation(board, rollout_worker['scheme'], None, rollout_worker['rollout_plies'],
+                                       random.Random(seed))
+
+def run_tree_parallel(root, board, max_time=None, scheme='material_count', workers=2, budget=None,
+                      rollout_plies=ROLLOUT_PLIES, rng=random, solver=True):
+  """ Tree parallelism: one tree in this process; leaves are selected under virtual loss and their
+  rollouts run in a pool of `workers` processes, with results backpropagated as they arrive.
+  Results arrive in completion order, so a seed fixes the rollouts but not the tree.
+  """
+  if budget is None:
+    budget = SearchBudget(max_time=max_time)
+  budget.nodes = count_nodes(root)
+  budget.arm(root.visits)
+  finished = queue.Queue()
+  in_flight = 0
+
+  with multiprocessing.Pool(workers, initializer=init_rollout_worker,
+                            initargs=(board, scheme, rollout_plies)) as pool:
+    while True:
+      stop = best_move_decided(root, budget)
+      while not stop and in_flight < 2 * workers and not budget.exhausted(in_flight):
+        node, simulation_board, expanded = select_leaf(root, board, solver)
+        budget.nodes += expanded
+        if node.proven is not None:
+          # Proven results are backed up here, without a playout
+          backpropagate(node, leaf_value(node, simulation_board.turn), simulation_board.turn, solver)
+          budget.playouts += 1
+          budget.arm(root.visits)
+          stop = best_move_decided(root, budget)
+          continue
+        add_virtual_loss(node)
+        leaf = (node, simulation_board.turn, expanded)
+        pool.apply_async(rollout_task, (simulation_board.move_stack[len(board.move_stack):], rng.getrandbits(32)),
+                         callback=lambda value, leaf=leaf: finished.put((leaf, value)),
+                         error_callback=lambda error, leaf=leaf: finished.put((leaf, None)))
+        in_flight += 1
+      if in_flight == 0:
+        break
+
+      # Playouts are a few plies long, so pending ones are still collected after a stop
+      (node, leaf_turn, expanded), value = finished.get()
+      in_flight -= 1
+      remove_virtual_loss(node)
+      if value is None:
+        abandon_leaf(node, expanded)
+        budget.nodes -= expanded
+        continue
+      backpropagate(node, value, leaf_turn, solver)
+      budget.playouts += 1
+      budget.evaluations += 1
+      budget.arm(root.visits)
+
+  return budget
+
+def root_parallel_task(board, scheme, rollout_plies, budget, seed, solver):
+  root = Node()
+  run_simulations(root, board, scheme=scheme, budget=budget, rollout_plies=rollout_plies, rng=random.Random(seed),
+                  solver=solver)
+  return [(child.move, child.visits, child.value, child.proven) for child in root.children]
+
+def run_root_parallel(board, max_time=None, scheme='material_count', workers=2, budget=None,
+                      rollout_plies=ROLLOUT_PLIES, rng=random, solver=True):
+  """ Root parallelism: `workers` processes grow independent trees, each with an equal share of
+  the playout and node budget; their root children are merged by summing visits and averaging
+  values, keeping any proven result. Returns the merged root.
+  """
+  if budget is None:
+    budget = SearchBudget(max_time=max_time)
+  tasks = [(board, scheme, rollout_plies, budget.split(workers), rng.getrandbits(32), solver)
+           for _ in range(workers)]
+  with multiprocessing.Pool(workers) as pool:
+    trees = pool.starmap(root_parallel_task, tasks)
+
+  root = Node()
+  root.untried_moves = []
+  merged = {}
+  for tree in trees:
+    for move, visits, value, proven in tree:
+      if move not in merged:
+        merged[move] = Node(move=move, parent=root)
+        root.children.append(merged[move])
+      merged[move].visits += visits
+      merged[move].value += visits * value  # reward total, divided out below
+      if proven is not None:
+        merged[move].proven = proven
+      root.visits += visits
+  for child in root.children:
+    child.value /= child.visits
+  budget.playouts = budget.evaluations = root.visits
+  budget.nodes = len(root.children) + 1
+  return root
+
+
+class MCTSEngine:
+  """ MCTS that keeps its search tree between calls.
+
+  After each search the tree stays rooted at the searched position. When the next position is
+  reached from it by the moves played since (the engine's move, the opponent's reply), the root
+  is advanced through those moves and the rest of the tree is dropped; otherwise a fresh tree
+  is started. Rollout positions are scored through the engine's EvaluationCache, which engines
+  may share (`eval_cache`); by default each gets its own.
+
+  engine = MCTSEngine(scheme='combined')
+  engine.set_position(fen, ['e2e4'])
+  move = engine.go(max_time=10)
+  """
+  def __init__(self, scheme='material_count', rollout_plies=ROLLOUT_PLIES, seed=None, solver=True, eval_cache=None):
+    self.scheme = scheme
+    self.eval_cache = eval_cache if eval_cache is not None else EvaluationCache()
+    self.rollout_plies = rollout_plies
+    self.solver = solver
+    self.rng = random.Random(seed)
+    self.board = chess.Board()
+    self.root = None
+    self.root_board = None
+    self.budget = None
+    self.reused_visits = 0
+
+  def new_game(self):
+    self.root = None
+    self.root_board = None
+    self.eval_cache.clear()
+
+  def set_position(self, fen=None, moves=()):
+    """ Set the root to `fen` (start position if None) followed by `moves` (UCI strings or Moves). """
+    self.board = chess.Board(fen) if fen else chess.Board()
+    for move in moves:
+      self.board.push(chess.Move.from_uci(move) if isinstance(move, str) else move)
+
+  def advance_root(self):
+    """ Move the root down to the current position if it is in the tree, else start a new tree. """
+    node = None
+    if self.root is not None:
+      node = self.root
+      old_stack = self.root_board.move_stack
+      new_stack = self.board.move_stack
+      if self.root_board.root() != self.board.root() or new_stack[:len(old_stack)] != old_stack:
+        node = None
+      else:
+        for move in new_stack[len(old_stack):]:
+          node = next((child for child in node.children if child.move == move), None)
+          if node is None:
+            break
+      # Same position reached by a different line (e.g. a FEN-only set_position)
+      if node is None and self.root_board.fen() == self.board.fen():
+        node = self.root
+
+    if node is None:
+      node = Node()
+    node.parent = None  # detach, so the rest of the old tree can be freed
+    self.root = node
+    self.root_board = self.board.copy()
+    self.reused_visits = node.visits
 
-  return max(root.children, key=lambda c: c.visits).move
\ No newline at end of file
+  def go(self, max_time=None, max_playouts=None, max_nodes=None, batch_size=1):
+    """ Search the current position and return the best root move (see best_child). max_nodes caps the whole
+    tree, including the part reused from the previous search.
+    """
+    self.advance_root()
+    self.budget = SearchBudget(max_playouts, max_nodes, max_time)
+    run_simulations(self.root, self.board, scheme=self.scheme, budget=self.budget, rollout_plies=self.rollout_plies,
+                    rng=self.rng, batch_size=batch_size, solver=self.solver, eval_cache=self.eval_cache)
+    return best_child(self.root).move
@@ -1,59 +1,571 @@
 import chess
+import multiprocessing
+import queue
 import time
 from board_evaluation_functions import evaluate_board
+from evaluation_cache import EvaluationCache
+from transposition_table import TranspositionTable, zobrist_key, EXACT, LOWER, UPPER
+from transposition_table import create_shared_table, attach_shared_table, close_shared_table
+from move_ordering import NoOrdering, make_orderer, mvv_lva
+from time_manager import TimeManager, SearchTimeout
+from constants import PAWN_VALUE, KNIGHT_VALUE, BISHOP_VALUE, ROOK_VALUE, QUEEN_VALUE
 
+MAX_PLY = 128
 
-def minimax_search(board, alpha, beta, depth, scheme):
-  if board.is_checkmate():
-    return -float('inf') if board.turn == chess.WHITE else float('inf')
-  if board.is_stalemate() or board.is_insufficient_material():
+# Material a capture or promotion can swing, used by delta pruning in quiescence
+DELTA_PIECE_VALUES = {
+  chess.PAWN: PAWN_VALUE,
+  chess.KNIGHT: KNIGHT_VALUE,
+  chess.BISHOP: BISHOP_VALUE,
+  chess.ROOK: ROOK_VALUE,
+  chess.QUEEN: QUEEN_VALUE,
+  chess.KING: 0
+}
+PROMOTION_RANKS = chess.BB_RANK_1 | chess.BB_RANK_8
+
+
+class SearchOptions:
+  """ Switches for the optional search features, so each can be benchmarked on its own.
+
+  quiescence: extend captures/promotions past depth 0 instead of evaluating mid-exchange
+  qsearch_checks: also try quiet checking moves on the first quiescence ply
+  max_qply: hard cap on quiescence depth
+  delta_margin: skip captures that cannot lift the stand-pat score to alpha even with this bonus
+  pvs: principal variation search - null-window searches for every move after the first
+  aspiration: search each iteration in a window around the previous iteration's score
+  aspiration_window: half-width of the first aspiration window, grown on every fail
+  aspiration_retries: failed windows tolerated before falling back to a full-width search
+  null_move: null-move pruning, reducing the verification search by null_move_reduction plies
+  lmr: late move reductions - quiet moves after the first lmr_min_moves are searched lmr_reduction
+       plies shallower, and re-searched at full depth if they beat the bound
+  futility: skip quiet moves at depth d when static eval + futility_margins[d] can't reach the bound
+  reverse_futility: return early at depth <= reverse_futility_depth when static eval minus
+       reverse_futility_margin per ply is still past the bound
+  """
+  def __init__(self, quiescence=True, qsearch_checks=False, max_qply=8, delta_margin=200,
+               pvs=True, aspiration=True, aspiration_window=50, aspiration_retries=3,
+               null_move=True, null_move_reduction=2, null_move_min_depth=3,
+               lmr=True, lmr_reduction=1, lmr_min_depth=3, lmr_min_moves=3,
+               futility=True, futility_margins=(0, 200, 500),
+               reverse_futility=True, reverse_futility_margin=120, reverse_futility_depth=3):
+    self.quiescence = quiescence
+    self.qsearch_checks = qsearch_checks
+    self.max_qply = max_qply
+    self.delta_margin = delta_margin
+    self.pvs = pvs
+    self.aspiration = aspiration
+    self.aspiration_window = aspiration_window
+    self.aspiration_retries = aspiration_retries
+    self.null_move = null_move
+    self.null_move_reduction = null_move_reduction
+    self.null_move_min_depth = null_move_min_depth
+    self.lmr = lmr
+    self.lmr_reduction = lmr_reduction
+    self.lmr_min_depth = lmr_min_depth
+    self.lmr_min_moves = lmr_min_moves
+    self.futility = futility
+    self.futility_margins = futility_margins
+    self.reverse_futility = reverse_futility
+    self.reverse_futility_margin = reverse_futility_margin
+    self.reverse_futility_depth = reverse_futility_depth
+
+  @classmethod
+  def plain(cls):
+    """ Every feature off - plain alpha-beta, as used by a bare minimax_search call. """
+    return cls(quiescence=False, pvs=False, aspiration=False, null_move=False, lmr=False,
+               futility=False, reverse_futility=False)
+
+
+class SearchContext:
+  """ State shared by every node of one search: scheme, transposition table, evaluation cache,
+  move orderer, time manager and node count. """
+  def __init__(self, scheme='material_count', tt=None, orderer=None, options=None, eval_cache=None):
+    self.scheme = scheme
+    self.tt = tt
+    self.eval_cache = eval_cache
+    self.orderer = orderer if orderer is not None else NoOrdering()
+    self.options = options if options is not None else SearchOptions.plain()
+    self.timer = TimeManager()
+    self.nodes = 0
+    # Triangular PV table for the running iteration and the line found by the previous one
+    self.pv_table = [[] for _ in range(MAX_PLY + 1)]
+    self.prev_pv = []
+    self.root_ply = 0
+
+
+class SearchResult:
+  """ Outcome of an iterative deepening search. Scores are from White's point of view.
+  `time` is when the reported depth completed; `overshoot` is how far the search ran past its hard limit.
+  """
+  def __init__(self, move=None, pv=None, score=0, depth=0, nodes=0, time=0.0, overshoot=0.0):
+    self.move = move
+    self.pv = pv if pv is not None else []
+    self.score = score
+    self.depth = depth
+    self.nodes = nodes
+    self.time = time
+    self.overshoot = overshoot
+
+  def __repr__(self):
+    return 'SearchResult(move={}, score={}, depth={}, pv={})'.format(
+      self.move, self.score, self.depth, ' '.join(move.uci() for move in self.pv))
+
+
+def pv_move_at(board, ctx, ply):
+  """ The previous iteration's PV move for this node, if the current path is still on that PV. """
+  prev_pv = ctx.prev_pv
+  if ply >= len(prev_pv):
+    return None
+  if board.move_stack[ctx.root_ply:] != prev_pv[:ply]:
+    return None
+  return prev_pv[ply]
+
+
+def null_window_search(board, alpha, beta, depth, scheme, ctx, ply, maximizing, reduction=0):
+  """ PVS child search: prove the move is no better than the current best with a zero-width
+  window, and re-search with the full window only when that proof fails.
+  `maximizing` is the side that moved into `board`. With a late move `reduction` the proof is
+  attempted at reduced depth first and repeated at full depth if the move looks better.
+  """
+  if maximizing and alpha != -float('inf'):
+    window_alpha, window_beta = alpha, alpha + 1
+  elif not maximizing and beta != float('inf'):
+    window_alpha, window_beta = beta - 1, beta
+  else:
+    window_alpha, window_beta = alpha, beta
+  score = minimax_search(board, window_alpha, window_beta, depth - reduction, scheme, ctx, ply)
+
+  if reduction:
+    if (score > alpha) if maximizing else (score < beta):
+      return null_window_search(board, alpha, beta, depth, scheme, ctx, ply, maximizing)
+    return score
+  if (window_alpha, window_beta) != (alpha, beta) and alpha < score < beta:
+    score = minimax_search(board, alpha, beta, depth, scheme, ctx, ply)
+  return score
+
+def mate_or_draw(maximizing, in_check):
+  """ Score of a position with no legal moves; `maximizing` is the side to move. """
+  if not in_check:
+    return 0
+  return -float('inf') if maximizing else float('inf')
+
+def minimax_search(board, alpha, beta, depth, scheme, ctx=None, ply=0):
+  if ctx is None:
+    ctx = SearchContext(scheme)
+  ctx.nodes += 1
+  ctx.timer.check()
+  ctx.pv_table[ply] = []
+
+  # Legal moves are generated at most once per node; mate and stalemate are read off that
+  # list and the check status instead of separate is_checkmate()/is_stalemate() calls
+  if board.is_insufficient_material():
     return 0
-  if depth == 0:
-    return evaluate_board(board, scheme=scheme)
-  
-  if board.turn == chess.WHITE:
-    max_score = -float('inf')
-    for move in board.legal_moves:
-      board.push(move)
-      score = minimax_search(board, alpha, beta, depth - 1, scheme)
-      max_score = max(max_score, score)
+  maximizing = board.turn == chess.WHITE
+  in_check = board.is_check()
+  if depth == 0 or ply >= MAX_PLY:
+    if ctx.options.quiescence:
+      return quiescence_search(board, alpha, beta, scheme, ctx, ply, in_check=in_check)
+    if not any(board.generate_legal_moves()):
+      return mate_or_draw(maximizing, in_check)
+    return evaluate_board(board, scheme=scheme, check_draw=False, cache=ctx.eval_cache)
+
+  # Transposition table cutoff - scores are stored from White's point of view,
+  # so the bounds tighten alpha/beta the same way for both sides
+  tt = ctx.tt
+  tt_move = None
+  if tt is not None:
+    key = zobrist_key(board)
+    entry = tt.probe(key)
+    if entry is not None:
+      tt_depth, tt_score, tt_flag, tt_move = entry
+      if tt_depth >= depth:
+        if tt_flag == EXACT:
+          return tt_score
+        if tt_flag == LOWER:
+          alpha = max(alpha, tt_score)
+        elif tt_flag == UPPER:
+          beta = min(beta, tt_score)
+        if beta <= alpha:
+          return tt_score
+
+  moves = list(board.generate_legal_moves())
+  if not moves:
+    return mate_or_draw(maximizing, in_check)
+
+  options = ctx.options
+  static_eval = None
+
+  # Reverse futility - the static score is so far past the bound that a shallow search won't come back
+  if options.reverse_futility and not in_check and depth <= options.reverse_futility_depth:
+    static_eval = evaluate_board(board, scheme=scheme, check_draw=False, cache=ctx.eval_cache)
+    margin = options.reverse_futility_margin * depth
+    if maximizing and static_eval - margin >= beta:
+      return static_eval - margin
+    if not maximizing and static_eval + margin <= alpha:
+      return static_eval + margin
+
+  # Null move - if passing still fails high, a real move will too. Skipped in check, right after
+  # another null move, and when the side to move has only king and pawns (zugzwang risk)
+  if options.null_move and not in_check and depth >= options.null_move_min_depth \
+      and not (board.move_stack and not board.move_stack[-1]) \
+      and board.occupied_co[board.turn] & ~(board.pawns | board.kings):
+    if static_eval is None:
+      static_eval = evaluate_board(board, scheme=scheme, check_draw=False, cache=ctx.eval_cache)
+    null_depth = max(0, depth - 1 - options.null_move_reduction)
+    if maximizing and beta != float('inf') and static_eval >= beta:
+      board.push(chess.Move.null())
+      score = minimax_search(board, beta - 1, beta, null_depth, scheme, ctx, ply + 1)
       board.pop()
+      if score >= beta:
+        return beta
+    elif not maximizing and alpha != -float('inf') and static_eval <= alpha:
+      board.push(chess.Move.null())
+      score = minimax_search(board, alpha, alpha + 1, null_depth, scheme, ctx, ply + 1)
+      board.pop()
+      if score <= alpha:
+        return alpha
+
+  # Futility - near the leaves, quiet moves can't recover a static score this far behind the bound
+  futile = False
+  if options.futility and not in_check and depth < len(options.futility_margins):
+    if static_eval is None:
+      static_eval = evaluate_board(board, scheme=scheme, check_draw=False, cache=ctx.eval_cache)
+    margin = options.futility_margins[depth]
+    futile = static_eval + margin <= alpha if maximizing else static_eval - margin >= beta
+  reduce_late_moves = options.lmr and not in_check and depth >= options.lmr_min_depth
+
+  alpha_orig, beta_orig = alpha, beta
+  best_move = None
+  best_score = -float('inf') if maximizing else float('inf')
+  orderer = ctx.orderer
+  # Follow the previous iteration's principal variation first
+  hash_move = pv_move_at(board, ctx, ply) or tt_move
+  moves = orderer.order_moves(board, moves, ply, hash_move)
+
+  for index, move in enumerate(moves):
+    quiet = not (move.promotion or board.is_capture(move))
+    if futile and quiet and best_move is not None and not board.gives_check(move):
+      continue
+
+    board.push(move)
+    reduction = 0
+    if reduce_late_moves and quiet and index >= options.lmr_min_moves and not board.is_check():
+      reduction = min(options.lmr_reduction, depth - 1)
+    if best_move is not None and (options.pvs or reduction):
+      score = null_window_search(board, alpha, beta, depth - 1, scheme, ctx, ply + 1, maximizing, reduction)
+    else:
+      score = minimax_search(board, alpha, beta, depth - 1, scheme, ctx, ply + 1)
+    board.pop()
+
+    if best_move is None or (score > best_score if maximizing else score < best_score):
+      best_score = score
+      best_move = move
+      ctx.pv_table[ply] = [move] + ctx.pv_table[ply + 1]
+    if maximizing:
       alpha = max(alpha, score)
-      if beta <= alpha:
-        break
-    return max_score
+    else:
+      beta = min(beta, score)
+    if beta <= alpha:
+      orderer.record_cutoff(board, move, ply, depth)
+      break
+
+  if tt is not None:
+    if best_score <= alpha_orig:
+      flag = UPPER
+    elif best_score >= beta_orig:
+      flag = LOWER
+    else:
+      flag = EXACT
+    tt.store(key, depth, best_score, flag, best_move)
+  return best_score
+
+def quiescence_search(board, alpha, beta, scheme, ctx, ply, qply=0, in_check=None):
+  """ Resolve captures (and promotions, optionally checks) so leaves are never scored mid-exchange.
+
+  At qply 0 the caller has already ruled out insufficient material and may pass `in_check`.
+  """
+  ctx.timer.check()
+  options = ctx.options
+  check_draw = qply > 0
+  if qply >= options.max_qply or ply >= MAX_PLY:
+    return evaluate_board(board, scheme=scheme, check_draw=check_draw, cache=ctx.eval_cache)
+  if in_check is None:
+    in_check = board.is_check()
+  maximizing = board.turn == chess.WHITE
+
+  if in_check:
+    # No stand-pat when in check - every evasion has to be searched
+    moves = list(board.generate_legal_moves())
+    if not moves:
+      return mate_or_draw(maximizing, in_check)
+    best_score = -float('inf') if maximizing else float('inf')
   else:
-    min_score = float('inf')
-    for move in board.legal_moves:
-      board.push(move)
-      score = minimax_search(board, alpha, beta, depth - 1, scheme)
-      min_score = min(min_score, score)
-      board.pop()
+    # Stalemate only matters at the horizon node itself; deeper, only captures are looked at
+    if qply == 0 and not any(board.generate_legal_moves()):
+      return 0
+    stand_pat = evaluate_board(board, scheme=scheme, check_draw=check_draw, cache=ctx.eval_cache)
+    if maximizing:
+      if stand_pat >= beta:
+        return stand_pat
+      alpha = max(alpha, stand_pat)
+    else:
+      if stand_pat <= alpha:
+        return stand_pat
+      beta = min(beta, stand_pat)
+    best_score = stand_pat
+
+    moves = list(board.generate_legal_captures())
+    moves += list(board.generate_legal_moves(board.pawns, PROMOTION_RANKS & ~board.occupied))
+    moves.sort(key=lambda move: mvv_lva(board, move), reverse=True)
+    if options.qsearch_checks and qply == 0:
+      moves += [move for move in board.generate_legal_moves(to_mask=~board.occupied)
+                if not move.promotion and board.gives_check(move)]
+
+  for move in moves:
+    # Delta pruning - even winning the victim (plus a margin) leaves us below alpha/above beta
+    if not in_check and not move.promotion and board.is_capture(move):
+      victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+      swing = DELTA_PIECE_VALUES[victim] + options.delta_margin
+      if (stand_pat + swing <= alpha) if maximizing else (stand_pat - swing >= beta):
+        continue
+
+    ctx.nodes += 1
+    board.push(move)
+    score = quiescence_search(board, alpha, beta, scheme, ctx, ply + 1, qply + 1)
+    board.pop()
+
+    if maximizing:
+      best_score = max(best_score, score)
+      alpha = max(alpha, score)
+    else:
+      best_score = min(best_score, score)
       beta = min(beta, score)
+    if beta <= alpha:
+      break
+
+  return best_score
+
+def search_root(board, depth, ctx, alpha=-float('inf'), beta=float('inf')):
+  """ Search every root move, tightening the window as better moves are found.
+
+  Returns (score, best_move); the line is left in ctx.pv_table[0].
+  """
+  maximizing = board.turn == chess.WHITE
+  best_move = None
+  best_score = -float('inf') if maximizing else float('inf')
+  ctx.pv_table[0] = []
+
+  prev_best = ctx.prev_pv[0] if ctx.prev_pv else None
+  for move in ctx.orderer.order_moves(board, board.legal_moves, 0, prev_best):
+    board.push(move)
+    if ctx.options.pvs and best_move is not None:
+      score = null_window_search(board, alpha, beta, depth - 1, ctx.scheme, ctx, 1, maximizing)
+    else:
+      score = minimax_search(board, alpha, beta, depth - 1, ctx.scheme, ctx, 1)
+    board.pop()
+
+    if best_move is None or (score > best_score if maximizing else score < best_score):
+      best_score = score
+      best_move = move
+      ctx.pv_table[0] = [move] + ctx.pv_table[1]
+      # Later moves only need to prove they are no better than this one
+      if maximizing:
+        alpha = max(alpha, score)
+      else:
+        beta = min(beta, score)
       if beta <= alpha:
         break
-    return min_score
 
-def find_best_move(board, max_depth=4, time_limit=None, scheme='material_count'):
-  best_move = None
+  return best_score, best_move
+
+def aspiration_search(board, depth, ctx, prev_score):
+  """ Root search in a narrow window around the previous iteration's score, widening on failure. """
+  options = ctx.options
+  if not options.aspiration or depth < 3 or prev_score in (float('inf'), -float('inf')):
+    return search_root(board, depth, ctx)
+
+  window = options.aspiration_window
+  alpha, beta = prev_score - window, prev_score + window
+  for _ in range(options.aspiration_retries):
+    score, move = search_root(board, depth, ctx, alpha, beta)
+    if alpha < score < beta:
+      return score, move
+    window *= 4
+    if score <= alpha:
+      alpha = score - window
+    else:
+      beta = score + window
+  return search_root(board, depth, ctx)
+
+def complete_pv(board, pv, depth, tt):
+  """ Extend a PV cut short by transposition table hits with the table's best moves. """
+  pv = list(pv)
+  if tt is None or len(pv) >= depth:
+    return pv
+  line = board.copy()
+  for move in pv:
+    line.push(move)
+  while len(pv) < depth:
+    entry = tt.probe(zobrist_key(line))
+    if entry is None or entry[3] is None or not line.is_legal(entry[3]):
+      break
+    pv.append(entry[3])
+    line.push(entry[3])
+  return pv
+
+def iterative_deepening(board, ctx, max_depth, start_depth=1):
+  """ Yield a SearchResult after every completed depth, until the hard time limit aborts one. """
   start_time = time.time()
+  ctx.orderer.new_search()
+  ctx.root_ply = len(board.move_stack)
+  score = 0
 
-  for depth in range(1, max_depth + 1):
-    best_eval = -float('inf') if board.turn == chess.WHITE else float('inf')
-    for move in board.legal_moves:
-      board.push(move)
-      score = minimax_search(board, -float('inf'), float('inf'), depth - 1, scheme)
-      board.pop()
+  for depth in range(start_depth, max_depth + 1):
+    try:
+      score, move = aspiration_search(board, depth, ctx, score)
+    except SearchTimeout:
+      # Unwind the moves the aborted iteration left on the board
+      while len(board.move_stack) > ctx.root_ply:
+        board.pop()
+      return
+    if move is None:
+      return  # no legal moves
+
+    ctx.prev_pv = complete_pv(board, ctx.pv_table[0], depth, ctx.tt)
+    yield SearchResult(move, ctx.prev_pv, score, depth, ctx.nodes, time.time() - start_time)
+
+def search(board, max_depth=4, time_limit=None, scheme='material_count', tt_size_mb=16, ordering='heuristic',
+           threads=1, **options):
+  """ Iterative deepening search. Returns a SearchResult with the best move, PV, score and depth reached.
+
+  threads > 1 runs a Lazy SMP search in that many worker processes.
+  Extra keyword arguments are SearchOptions switches, e.g. quiescence=False.
+  """
+  if threads > 1:
+    return parallel_search(board, max_depth, time_limit, scheme, tt_size_mb, ordering, threads, **options)
 
-      if board.turn == chess.WHITE and score > best_eval:
-        best_eval = score
-        best_move = move
-      elif board.turn == chess.BLACK and score < best_eval:
-        best_eval = score
-        best_move = move
+  # One table for the whole call so each depth reuses what the shallower ones found
+  ctx = SearchContext(scheme, TranspositionTable(tt_size_mb) if tt_size_mb else None, make_orderer(ordering),
+                      SearchOptions(**options))
+  return run_search(board, ctx, max_depth, time_limit)
 
-    # If time limit exceeded, return current best move (and break the loop)
-    if time_limit is not None and (time.time() - start_time) > time_limit:
+def run_search(board, ctx, max_depth, time_limit):
+  """ Iterate until max_depth or the time manager stops us; returns the deepest completed result. """
+  ctx.timer = TimeManager.for_time_limit(time_limit)
+  result = SearchResult()
+
+  for result in iterative_deepening(board, ctx, max_depth):
+    # Past the soft limit, or the best move has settled - the next depth isn't worth starting
+    if ctx.timer.iteration_done(result.move):
       break
 
-  return best_move
\ No newline at end of file
+  result.overshoot = ctx.timer.overshoot()
+  return result
+
+
+class MinimaxEngine:
+  """ Minimax search that keeps its transposition table, history table and evaluation cache
+  between calls, so consecutive moves of a game or puzzle line and consecutive puzzles start warm.
+  Engines may share one EvaluationCache (`eval_cache`); by default each gets its own.
+
+  engine = MinimaxEngine(scheme='combined')
+  engine.set_position(fen, ['e2e4', 'e7e5'])
+  result = engine.go(max_depth=5, time_limit=10)
+  """
+  def __init__(self, scheme='material_count', tt_size_mb=16, ordering='heuristic', eval_cache=None, **options):
+    self.ordering = ordering
+    self.ctx = SearchContext(scheme, TranspositionTable(tt_size_mb) if tt_size_mb else None, make_orderer(ordering),
+                             SearchOptions(**options), eval_cache if eval_cache is not None else EvaluationCache())
+    self.board = chess.Board()
+
+  def new_game(self):
+    """ Forget everything learned so far. """
+    if self.ctx.tt is not None:
+      self.ctx.tt.clear()
+    self.ctx.eval_cache.clear()
+    self.ctx.orderer = make_orderer(self.ordering)
+
+  def set_position(self, fen=None, moves=()):
+    """ Set the root to `fen` (start position if None) followed by `moves` (UCI strings or Moves). """
+    self.board = chess.Board(fen) if fen else chess.Board()
+    for move in moves:
+      self.board.push(chess.Move.from_uci(move) if isinstance(move, str) else move)
+
+  def go(self, max_depth=4, time_limit=None):
+    """ Search the current position. Returns a SearchResult. """
+    ctx = self.ctx
+    ctx.nodes = 0
+    # The table's best moves already lead the new search; a stale PV from another root would not
+    ctx.prev_pv = []
+    if ctx.tt is not None:
+      ctx.tt.new_search()
+    return run_search(self.board, ctx, max_depth, time_limit)
+
+# LAZY SMP - worker processes search the same root at staggered depths and share one
+# transposition table in shared memory; the coordinator keeps the deepest completed result
+
+def lazy_smp_worker(worker_id, board, max_depth, scheme, tt_name, tt_size_mb, ordering, options, results):
+  shm, tt = attach_shared_table(tt_name, tt_size_mb)
+  try:
+    ctx = SearchContext(scheme, tt, make_orderer(ordering), SearchOptions(**options))
+    # Odd workers start one ply deeper so the helpers fill the table ahead of each other
+    for result in iterative_deepening(board, ctx, max_depth, 1 + worker_id % 2):
+      results.put((worker_id, result.depth, result.score, [move.uci() for move in result.pv], result.nodes))
+  finally:
+    close_shared_table(shm, tt)
+    results.put((worker_id, None, None, None, None))
+
+def parallel_search(board, max_depth=4, time_limit=None, scheme='material_count', tt_size_mb=16,
+                    ordering='heuristic', threads=2, **options):
+  """ Lazy SMP search, stopped by the same TimeManager rules as run_search: the clock starts before
+  the workers do, the soft limit and a settled best move end the search once a depth completes, and
+  the overshoot covers stopping the workers as well.
+  """
+  timer = TimeManager.for_time_limit(time_limit)
+  shm, tt = create_shared_table(tt_size_mb or 16)
+  results = multiprocessing.Queue()
+  workers = [multiprocessing.Process(target=lazy_smp_worker, daemon=True,
+                                     args=(i, board, max_depth, scheme, shm.name, tt_size_mb or 16,
+                                           ordering, options, results))
+             for i in range(threads)]
+  best = SearchResult()
+  nodes = [0] * threads
+  finished = 0
+
+  try:
+    for worker in workers:
+      worker.start()
+    while finished < threads:
+      # Past the deadline only wait if nothing has completed yet
+      timeout = None
+      if timer.hard_limit is not None and best.move is not None:
+        timeout = timer.hard_limit - timer.elapsed()
+        if timeout <= 0:
+          break
+      try:
+        worker_id, depth, score, pv, worker_nodes = results.get(timeout=timeout)
+      except queue.Empty:
+        break
+      if depth is None:
+        finished += 1
+        continue
+      nodes[worker_id] = worker_nodes
+      if depth > best.depth:
+        pv = [chess.Move.from_uci(move) for move in pv]
+        best = SearchResult(pv[0], pv, score, depth, 0, timer.elapsed())
+        if timer.iteration_done(best.move):
+          break
+  finally:
+    for worker in workers:
+      if worker.is_alive():
+        worker.terminate()
+      worker.join()
+    close_shared_table(shm, tt, unlink=True)
+
+  best.nodes = sum(nodes)
+  best.overshoot = timer.overshoot()
+  return best
+
+def find_best_move(board, max_depth=4, time_limit=None, scheme='material_count', tt_size_mb=16, ordering='heuristic',
+                   threads=1, **options):
+  return search(board, max_depth, time_limit, scheme, tt_size_mb, ordering, threads, **options).move
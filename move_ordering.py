@@ -0,0 +1,111 @@
+import chess
+
+# Score bands - every hash move beats every capture, which beats every killer, etc.
+HASH_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORES = (90000, 89000)
+HISTORY_MAX = 80000
+
+# Victim/attacker weights for MVV-LVA (most valuable victim, least valuable attacker)
+MVV_LVA_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+    chess.KING: 0
+}
+
+
+def mvv_lva(board, move):
+  """ Capture score: 10 * victim - attacker, so QxP < PxQ. Promotions count as winning a queen. """
+  if board.is_en_passant(move):
+    victim = chess.PAWN
+  else:
+    victim = board.piece_type_at(move.to_square)
+  score = 10 * MVV_LVA_VALUES[victim] if victim else 0
+  if move.promotion:
+    score += 10 * MVV_LVA_VALUES[move.promotion]
+  return score - MVV_LVA_VALUES[board.piece_type_at(move.from_square)]
+
+
+class NoOrdering:
+  """ Searches moves in generator order. Used as the baseline when benchmarking ordering. """
+  def new_search(self):
+    pass
+
+  def order_moves(self, board, moves, ply, hash_move=None):
+    return list(moves)
+
+  def record_cutoff(self, board, move, ply, depth):
+    pass
+
+
+class MvvLvaOrdering(NoOrdering):
+  """ Hash move first, then captures/promotions by MVV-LVA, then quiet moves in generator order. """
+  def score_move(self, board, move, ply, hash_move):
+    if move == hash_move:
+      return HASH_MOVE_SCORE
+    if move.promotion or board.is_capture(move):
+      return CAPTURE_SCORE + mvv_lva(board, move)
+    return 0
+
+  def order_moves(self, board, moves, ply, hash_move=None):
+    return sorted(moves, key=lambda move: self.score_move(board, move, ply, hash_move), reverse=True)
+
+
+class HeuristicOrdering(MvvLvaOrdering):
+  """ Hash move, MVV-LVA captures, two killer moves per ply, then the history heuristic. """
+  def __init__(self, max_ply=128):
+    self.killers = [[None, None] for _ in range(max_ply)]
+    self.history = [[[0] * 64 for _ in range(64)] for _ in (chess.BLACK, chess.WHITE)]
+
+  def new_search(self):
+    """ Killers are position-specific, so drop them; history is only aged. """
+    for killers in self.killers:
+      killers[0] = killers[1] = None
+    for table in self.history:
+      for row in table:
+        for to_square in range(64):
+          row[to_square] //= 2
+
+  def score_move(self, board, move, ply, hash_move):
+    if move == hash_move:
+      return HASH_MOVE_SCORE
+    if move.promotion or board.is_capture(move):
+      return CAPTURE_SCORE + mvv_lva(board, move)
+    if ply < len(self.killers):
+      killers = self.killers[ply]
+      if move == killers[0]:
+        return KILLER_SCORES[0]
+      if move == killers[1]:
+        return KILLER_SCORES[1]
+    return self.history[board.turn][move.from_square][move.to_square]
+
+  def record_cutoff(self, board, move, ply, depth):
+    """ Called when `move` caused a beta cutoff; only quiet moves feed killers and history. """
+    if move.promotion or board.is_capture(move):
+      return
+    if ply < len(self.killers):
+      killers = self.killers[ply]
+      if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+    row = self.history[board.turn][move.from_square]
+    row[move.to_square] = min(HISTORY_MAX, row[move.to_square] + depth * depth)
+
+
+ORDERING_STRATEGIES = {
+    'none': NoOrdering,
+    'mvv_lva': MvvLvaOrdering,
+    'heuristic': HeuristicOrdering
+}
+
+
+def make_orderer(ordering='heuristic'):
+  """ Accepts a strategy name from ORDERING_STRATEGIES or an orderer instance. """
+  if isinstance(ordering, str):
+    if ordering not in ORDERING_STRATEGIES:
+      raise ValueError("Unknown move ordering: " + ordering)
+    return ORDERING_STRATEGIES[ordering]()
+  return ordering
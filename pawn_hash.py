@@ -0,0 +1,52 @@
+import chess
+from chess.polyglot import POLYGLOT_RANDOM_ARRAY
+
+# Polyglot keys of the pawns: piece index 0 is a black pawn, 1 a white pawn
+PAWN_ZOBRIST = [POLYGLOT_RANDOM_ARRAY[64 * color:64 * color + 64] for color in (chess.BLACK, chess.WHITE)]
+
+
+def pawn_key(board):
+  """ Zobrist key of the pawns alone (the pawn terms of the polyglot position key). """
+  key = 0
+  for color in (chess.BLACK, chess.WHITE):
+    keys = PAWN_ZOBRIST[color]
+    for square in chess.scan_forward(board.pieces_mask(chess.PAWN, color)):
+      key ^= keys[square]
+  return key
+
+
+class PawnHashTable:
+  """ Fixed-size cache of pawn-structure results keyed by pawn_key.
+
+  Pawn structure rarely changes between neighbouring nodes, so most lookups hit. Each slot
+  holds one entry and is always replaced; the full key is kept to reject index collisions.
+  """
+  def __init__(self, entries=1 << 14):
+    self.size = entries
+    self.keys = [None] * entries
+    self.entries = [None] * entries
+    self.probes = 0
+    self.hits = 0
+
+  def clear(self):
+    self.keys = [None] * self.size
+    self.entries = [None] * self.size
+    self.probes = 0
+    self.hits = 0
+
+  def probe(self, key):
+    """ The entry stored for `key`, or None. """
+    self.probes += 1
+    index = key % self.size
+    if self.keys[index] == key:
+      self.hits += 1
+      return self.entries[index]
+    return None
+
+  def store(self, key, entry):
+    index = key % self.size
+    self.keys[index] = key
+    self.entries[index] = entry
+
+  def hit_rate(self):
+    return self.hits / self.probes if self.probes else 0.0
@@ -4,8 +4,8 @@ import time
 from board import ChessBoard  # Import the ChessBoard class
 
 # Import AI functions
-from mcts_module import select_best_move as mcts_move
-from minimax_module import find_best_move as minimax_move
+from mcts_module import MCTSEngine
+from minimax_module import MinimaxEngine
 from stockfish import Stockfish
 import time
 
@@ -172,15 +172,23 @@ def getStockfish(board, max_time):
 def play_ai_game(board, moves, ai_type, max_time):
     print(moves)
 
+    # One engine for the whole puzzle so its tables/tree carry over between moves
+    if ai_type == "mcts":
+        engine = MCTSEngine()
+    elif ai_type == "minimax":
+        engine = MinimaxEngine()
+
     def handleAIMove():
         fen = gameWindow.getCurrentFEN()
         if gameWindow.isUserTurn():
             print("Waiting for AI move...")
+            if ai_type in ("mcts", "minimax"):
+                engine.set_position(board.fen(), gameWindow.gameBoard.move_stack)
             if ai_type == "mcts":
-                best_move = mcts_move(ChessBoard(fen), max_time).uci()
+                best_move = engine.go(max_time).uci()
             elif ai_type == "minimax":
                 # Assume max_depth correlates with max_time
-                best_move = minimax_move(ChessBoard(fen), 4, max_time).uci()
+                best_move = engine.go(4, max_time).move.uci()
             elif ai_type == "stockfish":
                 sf.set_fen_position(fen)
                 sf.set_depth(max_time)  # Set Stockfish depth
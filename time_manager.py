@@ -0,0 +1,77 @@
+import time
+
+
+class SearchTimeout(Exception):
+  """ Raised inside a search once the hard deadline has passed. """
+
+
+class TimeManager:
+  """ Time control shared by the minimax and MCTS searches.
+
+  soft_limit: no new iteration is started past this (minimax) / searching stops here (MCTS)
+  hard_limit: the search is aborted from inside the recursion once this has passed
+  check_every: nodes or rollout plies between clock reads
+  anytime: allow aborting before the first iteration has completed (MCTS sets it once its root
+    has a backed-up playout; minimax needs one finished depth first)
+  stable_iterations / stable_fraction: stop once the best move has not changed for this many
+    iterations and at least this fraction of the soft limit is used
+  """
+  def __init__(self, soft_limit=None, hard_limit=None, check_every=64, stable_iterations=3, stable_fraction=0.3,
+               anytime=False):
+    self.soft_limit = soft_limit
+    self.hard_limit = hard_limit
+    self.check_every = check_every
+    self.stable_iterations = stable_iterations
+    self.stable_fraction = stable_fraction
+    self.anytime = anytime
+    self.start_time = time.time()
+    self.counter = 0
+    self.timed_out = False
+    self.best_move = None
+    self.stable_count = 0
+
+  @classmethod
+  def for_time_limit(cls, time_limit, soft_fraction=0.5, **kwargs):
+    """ Hard limit at `time_limit`; don't start work past `soft_fraction` of it. """
+    if time_limit is None:
+      return cls(**kwargs)
+    return cls(time_limit * soft_fraction, time_limit, **kwargs)
+
+  def elapsed(self):
+    return time.time() - self.start_time
+
+  def check(self):
+    """ Call once per node/ply; raises SearchTimeout every `check_every` calls past the hard limit. """
+    self.counter += 1
+    if self.counter < self.check_every:
+      return
+    self.counter = 0
+    if self.best_move is None and not self.anytime:
+      return
+    if self.hard_limit is not None and self.elapsed() >= self.hard_limit:
+      self.timed_out = True
+      raise SearchTimeout()
+
+  def soft_expired(self):
+    return self.soft_limit is not None and self.elapsed() >= self.soft_limit
+
+  def iteration_done(self, best_move):
+    """ Record a completed iteration's best move. Returns True when the search should stop. """
+    if best_move == self.best_move:
+      self.stable_count += 1
+    else:
+      self.best_move = best_move
+      self.stable_count = 1
+
+    if self.soft_limit is None:
+      return self.hard_limit is not None and self.elapsed() >= self.hard_limit
+    elapsed = self.elapsed()
+    if elapsed >= self.soft_limit:
+      return True
+    return self.stable_count >= self.stable_iterations and elapsed >= self.soft_limit * self.stable_fraction
+
+  def overshoot(self):
+    """ Seconds spent past the hard limit (0 when it was respected). """
+    if self.hard_limit is None:
+      return 0.0
+    return max(0.0, self.elapsed() - self.hard_limit)
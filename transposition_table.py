@@ -0,0 +1,167 @@
+import chess
+import chess.polyglot
+from array import array
+from multiprocessing import shared_memory
+
+# Bound types stored with every entry
+EXACT = 0
+LOWER = 1  # search failed high, score is a lower bound
+UPPER = 2  # search failed low, score is an upper bound
+
+# Each bucket holds two entries: slot 0 is depth-preferred, slot 1 is always-replace.
+# An entry is two 64-bit words (key ^ data, data), so a bucket is 4 words / 32 bytes.
+# Storing the key XORed with the data lets processes share a table without locks: a
+# torn write from another process fails the XOR check on probe and reads as a miss.
+WORDS_PER_ENTRY = 2
+ENTRIES_PER_BUCKET = 2
+BUCKET_BYTES = WORDS_PER_ENTRY * ENTRIES_PER_BUCKET * 8
+
+# Mate scores are +/-inf in the search; they are stored as the int32 extremes
+SCORE_OFFSET = 1 << 31
+SCORE_MAX = (1 << 31) - 1
+SCORE_MIN = -(1 << 31) + 1
+
+
+def zobrist_key(board):
+  """ 64-bit Zobrist hash of the position (polyglot keys). """
+  return chess.polyglot.zobrist_hash(board)
+
+
+def encode_move(move):
+  if move is None:
+    return 0
+  return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code):
+  if code == 0:
+    return None
+  return chess.Move(code & 63, (code >> 6) & 63, (code >> 12) & 7 or None)
+
+
+def encode_score(score):
+  if score == float('inf'):
+    return SCORE_MAX + SCORE_OFFSET
+  if score == -float('inf'):
+    return SCORE_MIN + SCORE_OFFSET
+  return max(SCORE_MIN + 1, min(SCORE_MAX - 1, int(score))) + SCORE_OFFSET
+
+
+def decode_score(code):
+  score = code - SCORE_OFFSET
+  if score == SCORE_MAX:
+    return float('inf')
+  if score == SCORE_MIN:
+    return -float('inf')
+  return score
+
+
+def pack_entry(depth, score, flag, move, generation=0):
+  """ Pack an entry into one 64-bit word: score(32) | generation(6) flag(2) depth(8) move(16). """
+  return (encode_score(score) << 32) | ((generation & 63) << 26) | ((flag & 3) << 24) \
+    | ((max(0, min(depth, 255))) << 16) | encode_move(move)
+
+
+def unpack_entry(data):
+  """ Returns (depth, score, flag, move) for a packed data word. """
+  return (data >> 16) & 255, decode_score(data >> 32), (data >> 24) & 3, decode_move(data & 0xFFFF)
+
+
+class TranspositionTable:
+  """ Bounded-memory transposition table keyed by 64-bit Zobrist hashes.
+
+  Entries are packed into a flat buffer of unsigned 64-bit words, so the memory
+  footprint is exactly `size_mb` regardless of how many positions are searched.
+  """
+  def __init__(self, size_mb=16, buffer=None):
+    self.num_buckets = max(1, int(size_mb * 1024 * 1024) // BUCKET_BYTES)
+    self.words = buffer if buffer is not None else array('Q', bytes(self.num_buckets * BUCKET_BYTES))
+    self.generation = 0
+    self.probes = 0
+    self.hits = 0
+    self.stores = 0
+
+  def clear(self):
+    raw = memoryview(self.words).cast('B')
+    raw[:] = bytes(len(raw))
+    self.generation = 0
+
+  def new_search(self):
+    """ Age existing entries so stale ones are replaced first. """
+    self.generation = (self.generation + 1) & 63
+
+  def _bucket(self, key):
+    return (key % self.num_buckets) * (WORDS_PER_ENTRY * ENTRIES_PER_BUCKET)
+
+  def probe(self, key):
+    """ Look up a position. Returns (depth, score, flag, move) or None. """
+    self.probes += 1
+    words = self.words
+    base = self._bucket(key)
+    for slot in (base, base + WORDS_PER_ENTRY):
+      data = words[slot + 1]
+      if data and words[slot] ^ data == key:
+        self.hits += 1
+        return unpack_entry(data)
+    return None
+
+  def store(self, key, depth, score, flag, move):
+    """ Store a search result using the depth-preferred / always-replace policy. """
+    self.stores += 1
+    words = self.words
+    base = self._bucket(key)
+    data = pack_entry(depth, score, flag, move, self.generation)
+
+    # Slot 0 keeps the deepest result; it is only overwritten by an equal or
+    # deeper search of any position, or by anything once the entry is stale.
+    old = words[base + 1]
+    old_depth = (old >> 16) & 255
+    old_generation = (old >> 26) & 63
+    if not old or depth >= old_depth or old_generation != self.generation or words[base] ^ old == key:
+      # Keep a useful previous entry by demoting it to the always-replace slot
+      if old and words[base] ^ old != key:
+        words[base + 2] = words[base]
+        words[base + 3] = old
+      words[base] = key ^ data
+      words[base + 1] = data
+      return
+
+    words[base + 2] = key ^ data
+    words[base + 3] = data
+
+  def hashfull(self):
+    """ Permille of sampled entries used by the current search (UCI style). """
+    sample = min(1000, self.num_buckets * ENTRIES_PER_BUCKET)
+    used = 0
+    for i in range(sample):
+      data = self.words[i * WORDS_PER_ENTRY + 1]
+      if data and (data >> 26) & 63 == self.generation:
+        used += 1
+    return used * 1000 // sample if sample else 0
+
+
+def table_bytes(size_mb):
+  """ Buffer size used by a table of `size_mb`, rounded down to whole buckets. """
+  return max(1, int(size_mb * 1024 * 1024) // BUCKET_BYTES) * BUCKET_BYTES
+
+
+def create_shared_table(size_mb=16):
+  """ Allocate a table in multiprocessing.shared_memory. Returns (shm, table); the creator must
+  call close_shared_table(shm, table, unlink=True) once every process is done with it.
+  """
+  shm = shared_memory.SharedMemory(create=True, size=table_bytes(size_mb))
+  shm.buf[:] = bytes(shm.size)
+  return shm, TranspositionTable(size_mb, buffer=shm.buf.cast('Q'))
+
+
+def attach_shared_table(name, size_mb=16):
+  """ Open a table created by create_shared_table in another process. Returns (shm, table). """
+  shm = shared_memory.SharedMemory(name=name)
+  return shm, TranspositionTable(size_mb, buffer=shm.buf.cast('Q'))
+
+
+def close_shared_table(shm, table, unlink=False):
+  table.words.release()
+  shm.close()
+  if unlink:
+    shm.unlink()